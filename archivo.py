@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Archivo histórico de ventas en bases separadas por año (pos_archivo_AAAA.db).
+
+Los cortes cerrados con más antigüedad que la configurada se mueven de la base
+principal a su archivo anual; Cortes y Resumen_Diario se quedan en la base
+principal, así que la operación diaria sólo toca una base pequeña. Los reportes
+adjuntan el archivo del año sólo cuando se consulta un corte antiguo.
+
+Uso como script:
+    python archivo.py <ruta_db> <carpeta_archivo> [días]
+"""
+import datetime
+import glob
+import os
+import re
+import sys
+
+from migraciones import convertir_a_centavos, compactar_detalle_venta
+
+# Tablas cuyas filas se mueven al archivo (Cortes y Resumen_Diario nunca salen de la base principal)
+TABLAS_ARCHIVADAS = ("Ventas", "Detalle_Venta", "Resumen_Producto_Diario")
+
+
+def ruta_archivo(carpeta, anio):
+    return os.path.join(carpeta, f"pos_archivo_{anio}.db")
+
+
+def _archivo_en_pesos(cursor, alias):
+    # Los archivos creados antes de la migración a centavos guardan los importes como REAL
+    cursor.execute(f"PRAGMA {alias}.table_info(Ventas)")
+    return any(fila[1] == "total" and fila[2].upper() == "REAL" for fila in cursor.fetchall())
+
+
+def _detalle_sin_compactar(cursor, alias):
+    cursor.execute(f"PRAGMA {alias}.table_info(Detalle_Venta)")
+    columnas = {fila[1] for fila in cursor.fetchall()}
+    return bool(columnas) and "linea" not in columnas
+
+
+def _archivo_desactualizado(cursor, alias):
+    return _archivo_en_pesos(cursor, alias) or _detalle_sin_compactar(cursor, alias)
+
+
+def _preparar_archivo(cursor, alias):
+    """ Crea en el archivo las tablas que falten, le añade las columnas nuevas de la base principal
+    y convierte los archivos anteriores a las migraciones 10 y 11.
+    """
+    if _archivo_en_pesos(cursor, alias):
+        for tabla in TABLAS_ARCHIVADAS:
+            convertir_a_centavos(cursor, tabla, alias)
+    if _detalle_sin_compactar(cursor, alias):
+        compactar_detalle_venta(cursor, alias)
+    for tabla in TABLAS_ARCHIVADAS:
+        cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+        sql = cursor.fetchone()[0]
+        cursor.execute(re.sub(r"^\s*CREATE TABLE\s+(IF NOT EXISTS\s+)?", f"CREATE TABLE IF NOT EXISTS {alias}.", sql, count=1))
+        cursor.execute(f"PRAGMA {alias}.table_info({tabla})")
+        existentes = {fila[1] for fila in cursor.fetchall()}
+        cursor.execute(f"PRAGMA main.table_info({tabla})")
+        for _, nombre, tipo, _, _, _ in cursor.fetchall():
+            if nombre not in existentes:
+                cursor.execute(f"ALTER TABLE {alias}.{tabla} ADD COLUMN {nombre} {tipo}")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_resumen_producto_corte ON Resumen_Producto_Diario(corte_id)")
+
+
+def _lista_columnas(cursor, tabla):
+    cursor.execute(f"PRAGMA main.table_info({tabla})")
+    return ", ".join(fila[1] for fila in cursor.fetchall())
+
+
+# Ventas de un corte: las marcadas con su corte_id (cortes antiguos) o las de su rango de ids
+SQL_VENTAS_DEL_CORTE = """
+    SELECT v.id FROM main.Ventas v JOIN main.Cortes c ON c.corte_id = ?
+    WHERE v.fecha_negocio = c.fecha_negocio
+      AND (v.corte_id = c.corte_id OR (v.corte_id IS NULL AND v.id BETWEEN c.id_venta_desde AND c.id_venta_hasta))
+"""
+
+
+def archivar_corte(gestor, corte_id, anio, carpeta):
+    """ Mueve las ventas, líneas y resumen por producto de un corte a su archivo anual. """
+    os.makedirs(carpeta, exist_ok=True)
+    with gestor.adjunto(ruta_archivo(carpeta, anio), "archivo", escritura=True):
+        # Primero se copia (y se confirma) en el archivo; después se borra de la base principal.
+        # Si algo falla entre ambos pasos, repetir el proceso no duplica ni pierde filas.
+        with gestor.transaccion() as cursor:
+            _preparar_archivo(cursor, "archivo")
+            columnas = {tabla: _lista_columnas(cursor, tabla) for tabla in TABLAS_ARCHIVADAS}
+            cursor.execute(f"INSERT OR IGNORE INTO archivo.Ventas ({columnas['Ventas']}) SELECT {columnas['Ventas']} FROM main.Ventas WHERE id IN ({SQL_VENTAS_DEL_CORTE})", (corte_id,))
+            cursor.execute(f"INSERT OR IGNORE INTO archivo.Detalle_Venta ({columnas['Detalle_Venta']}) SELECT {columnas['Detalle_Venta']} FROM main.Detalle_Venta WHERE id_venta IN ({SQL_VENTAS_DEL_CORTE})", (corte_id,))
+            cursor.execute(f"INSERT OR IGNORE INTO archivo.Resumen_Producto_Diario ({columnas['Resumen_Producto_Diario']}) SELECT {columnas['Resumen_Producto_Diario']} FROM main.Resumen_Producto_Diario WHERE corte_id = ?", (corte_id,))
+        with gestor.transaccion() as cursor:
+            cursor.execute(f"DELETE FROM main.Detalle_Venta WHERE id_venta IN ({SQL_VENTAS_DEL_CORTE})", (corte_id,))
+            cursor.execute(f"DELETE FROM main.Ventas WHERE id IN ({SQL_VENTAS_DEL_CORTE})", (corte_id,))
+            cursor.execute("DELETE FROM main.Resumen_Producto_Diario WHERE corte_id = ?", (corte_id,))
+            cursor.execute("UPDATE main.Cortes SET archivo = ? WHERE corte_id = ?", (anio, corte_id))
+
+
+def archivar_cortes_antiguos(gestor, carpeta, dias, hoy=None):
+    """ Archiva los cortes cerrados hace más de `dias` días. Devuelve cuántos se movieron. """
+    hoy = hoy or datetime.date.today()
+    limite = (hoy - datetime.timedelta(days=dias)).isoformat()
+    pendientes = gestor.consultar("SELECT corte_id, fecha_negocio FROM Cortes WHERE archivo IS NULL AND fecha_negocio < ? ORDER BY fecha_negocio", (limite,))
+    for corte_id, fecha in pendientes:
+        archivar_corte(gestor, corte_id, int(fecha[:4]), carpeta)
+        print(f"Corte {corte_id} movido a {ruta_archivo(carpeta, fecha[:4])}")
+    return len(pendientes)
+
+
+def consultar_archivo(gestor, carpeta, anio, sql, params=()):
+    """ Ejecuta una consulta sobre el archivo del año, adjuntado como 'archivo' sólo durante la consulta. """
+    ruta = ruta_archivo(carpeta, anio)
+    if not os.path.exists(ruta):
+        print(f"ADVERTENCIA: No se encontró el archivo histórico '{ruta}'.")
+        return []
+    with gestor.adjunto(ruta, "archivo") as conn:
+        desactualizado = _archivo_desactualizado(conn.cursor(), "archivo")
+    if desactualizado:
+        if gestor.solo_lectura:
+            print(f"ADVERTENCIA: El archivo histórico '{ruta}' tiene un formato anterior; ejecute actualizar_archivos.")
+            return []
+        _actualizar_archivo(gestor, ruta)
+    with gestor.adjunto(ruta, "archivo") as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def _actualizar_archivo(gestor, ruta):
+    with gestor.adjunto(ruta, "archivo", escritura=True):
+        with gestor.transaccion() as cursor:
+            _preparar_archivo(cursor, "archivo")
+
+
+def actualizar_archivos(gestor, carpeta):
+    """ Convierte al esquema actual los archivos anuales de la carpeta. Devuelve cuántos se convirtieron. """
+    convertidos = 0
+    for ruta in sorted(glob.glob(os.path.join(carpeta, "pos_archivo_*.db"))):
+        with gestor.adjunto(ruta, "archivo") as conn:
+            desactualizado = _archivo_desactualizado(conn.cursor(), "archivo")
+        if desactualizado:
+            _actualizar_archivo(gestor, ruta)
+            print(f"Archivo histórico actualizado: {ruta}")
+            convertidos += 1
+    return convertidos
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    gestor = GestorBD(sys.argv[1])
+    aplicar_migraciones(gestor)
+    movidos = archivar_cortes_antiguos(gestor, sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 365)
+    print(f"Cortes archivados: {movidos}")
+    gestor.cerrar()
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def es_bloqueo(error):
+    """ True si el error de SQLite se debe a que otra conexión tiene el candado de la base. """
+    mensaje = str(error).lower()
+    return "locked" in mensaje or "busy" in mensaje
+
+
+class GestorBD:
+    """ Mantiene abiertas las conexiones a la base de datos durante toda la vida de la App.
+
+    Hay una sola conexión de escritura (protegida por un candado) y una conexión de
+    lectura por hilo que se reutiliza en cada consulta, en lugar de abrir y cerrar
+    el archivo en cada evento de la interfaz.
+
+    Con solo_lectura=True todas las conexiones se abren en modo de sólo lectura. Los
+    reportes usan un gestor así: en WAL cada consulta lee una instantánea de la base
+    y nunca bloquea ni retrasa al escritor de ventas.
+
+    Varias terminales pueden compartir el archivo: si otra está escribiendo, cada
+    conexión espera hasta espera_ms antes de fallar, y transaccion() reintenta el
+    BEGIN IMMEDIATE hasta `reintentos` veces más con esperas crecientes.
+
+    Con ruta ":memory:" (ver clonar_en_memoria) hay una sola conexión, que también
+    atiende las lecturas: cada conexión a :memory: sería una base distinta. Por eso
+    ahí las lecturas toman el candado del escritor y esperan a que termine la
+    transacción en curso, en lugar de ver filas sin confirmar.
+    """
+
+    def __init__(self, ruta, cache_kb=8192, mmap_mb=64, cache_sentencias=128, solo_lectura=False,
+                 espera_ms=5000, reintentos=5):
+        self.ruta = ruta
+        self.solo_lectura = solo_lectura
+        self.espera_ms = espera_ms
+        self.reintentos = reintentos
+        self.cache_kb = cache_kb
+        self.mmap_mb = mmap_mb
+        self.cache_sentencias = cache_sentencias
+        self._escritor = None
+        self._candado_escritor = threading.RLock()
+        self._locales = threading.local()
+        self._lectores = []
+        self._candado_lectores = threading.Lock()
+
+    def _uri(self, ruta):
+        return pathlib.Path(ruta).resolve().as_uri() + "?mode=ro"
+
+    def _abrir(self):
+        # isolation_level=None: las transacciones se controlan explícitamente con BEGIN/COMMIT.
+        # cached_statements es la caché de sentencias preparadas de cada conexión.
+        # timeout es el busy_timeout: cuánto espera la conexión si otra terminal tiene el candado.
+        if self.solo_lectura:
+            conn = sqlite3.connect(self._uri(self.ruta), uri=True, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cache_sentencias, timeout=self.espera_ms / 1000)
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.ruta, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cache_sentencias, timeout=self.espera_ms / 1000)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_mb) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _obtener_escritor(self):
+        if self.solo_lectura:
+            raise sqlite3.OperationalError("El gestor de la base de datos es de sólo lectura.")
+        with self._candado_escritor:
+            if self._escritor is None:
+                conn = self._abrir()
+                # WAL permite que los lectores sigan consultando mientras se escribe una venta.
+                conn.execute("PRAGMA journal_mode = WAL")
+                self._escritor = conn
+            return self._escritor
+
+    def _empezar(self, conn):
+        # BEGIN IMMEDIATE toma el candado de escritura desde el inicio. Con un BEGIN normal,
+        # una transacción que lee y luego escribe falla sin esperar ("database is locked")
+        # si otra terminal guardó algo entre la lectura y la escritura.
+        for intento in range(self.reintentos + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if intento == self.reintentos or not es_bloqueo(e):
+                    raise
+                print(f"ADVERTENCIA: La base de datos está ocupada por otra terminal; reintento {intento + 1} de {self.reintentos}.")
+                time.sleep(min(2.0, 0.05 * 2 ** intento) * random.uniform(0.5, 1.0))
+
+    @contextmanager
+    def transaccion(self):
+        """ Ejecuta un bloque de escritura en una transacción sobre la conexión de escritura. """
+        with self._candado_escritor:
+            conn = self._obtener_escritor()
+            self._empezar(conn)
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    @contextmanager
+    def escritor(self):
+        """ Conexión de escritura sin abrir transacción, para PRAGMAs como VACUUM o wal_checkpoint. """
+        with self._candado_escritor:
+            yield self._obtener_escritor()
+
+    def lector(self):
+        """ Devuelve la conexión de lectura del hilo actual, abriéndola sólo la primera vez.
+
+        En una base en memoria use lectura(), que además toma el candado del escritor.
+        """
+        if self.ruta == ":memory:":
+            return self._obtener_escritor()
+        conn = getattr(self._locales, 'conn', None)
+        if conn is None:
+            # El escritor se abre primero para que el modo WAL ya esté activo.
+            if not self.solo_lectura:
+                self._obtener_escritor()
+            conn = self._abrir()
+            self._locales.conn = conn
+            with self._candado_lectores:
+                self._lectores.append(conn)
+        return conn
+
+    @contextmanager
+    def lectura(self):
+        """ Conexión para leer durante el bloque: la del hilo, o la única de una base en memoria con su candado. """
+        if self.ruta == ":memory:":
+            with self._candado_escritor:
+                yield self._obtener_escritor()
+        else:
+            yield self.lector()
+
+    @contextmanager
+    def adjunto(self, ruta, alias, escritura=False):
+        """ Adjunta otra base de datos (p. ej. un archivo anual) mientras dura el bloque.
+
+        Con escritura=True se adjunta a la conexión de escritura y se mantiene su candado;
+        si no, a la conexión de lectura del hilo actual. Devuelve la conexión usada.
+        """
+        if escritura:
+            with self._candado_escritor:
+                conn = self._obtener_escritor()
+                conn.execute(f"ATTACH DATABASE ? AS {alias}", (ruta,))
+                try:
+                    yield conn
+                finally:
+                    conn.execute(f"DETACH DATABASE {alias}")
+        else:
+            with self.lectura() as conn:
+                conn.execute(f"ATTACH DATABASE ? AS {alias}", (self._uri(ruta) if self.solo_lectura else ruta,))
+                try:
+                    yield conn
+                finally:
+                    conn.execute(f"DETACH DATABASE {alias}")
+
+    def clonar_en_memoria(self):
+        """ Copia la base completa a una base en memoria con la API de backup y devuelve su gestor.
+
+        La copia se hace en un solo paso desde la instantánea de la conexión de lectura,
+        así que no detiene a quien esté escribiendo en el archivo.
+        """
+        clon = GestorBD(":memory:", self.cache_kb, 0, self.cache_sentencias)
+        with clon.escritor() as destino, self.lectura() as origen:
+            origen.backup(destino)
+        return clon
+
+    def consultar(self, sql, params=()):
+        with self.lectura() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def consultar_uno(self, sql, params=()):
+        with self.lectura() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def cerrar(self):
+        """ Cierra todas las conexiones abiertas. Se llama al salir de la App. """
+        with self._candado_lectores:
+            for conn in self._lectores:
+                conn.close()
+            self._lectores.clear()
+        self._locales = threading.local()
+        with self._candado_escritor:
+            if self._escritor is not None:
+                self._escritor.close()
+                self._escritor = None
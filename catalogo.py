@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Carga y exportación del catálogo (categorías y productos) en CSV o JSON.
+
+Ambos formatos usan las mismas columnas: categoria, nombre, precio, precio_variable.
+En JSON el archivo es una lista de objetos con esas claves. Los precios del archivo
+están en pesos; en la base se guardan en centavos.
+"""
+import csv
+import json
+import os
+import re
+from collections import namedtuple
+
+from dinero import Dinero
+
+COLUMNAS = ("categoria", "nombre", "precio", "precio_variable")
+
+Producto = namedtuple("Producto", "id nombre precio precio_variable id_categoria")
+
+
+# El nombre pesa más que la categoría al ordenar los resultados de la búsqueda
+SQL_BUSCAR_PRODUCTOS = """
+    SELECT rowid FROM Busqueda_Productos WHERE Busqueda_Productos MATCH ?
+    ORDER BY bm25(Busqueda_Productos, 10.0, 1.0)
+"""
+
+
+def consulta_fts(termino):
+    """ Convierte lo escrito en una consulta de prefijos: 'camaron coct' -> '"camaron"* "coct"*'. """
+    return " ".join(f'"{palabra}"*' for palabra in re.findall(r"\w+", termino))
+
+
+def buscar_productos(gestor, termino):
+    """ Ids de los productos que coinciden con el término, del más al menos relevante. """
+    consulta = consulta_fts(termino)
+    if not consulta:
+        return []
+    return [fila[0] for fila in gestor.consultar(SQL_BUSCAR_PRODUCTOS, (consulta,))]
+
+
+def _a_booleano(valor):
+    if isinstance(valor, str):
+        return valor.strip().lower() in ("1", "si", "sí", "true", "verdadero", "x")
+    return bool(valor)
+
+
+def leer_menu(ruta):
+    """ Lee un archivo .csv o .json y devuelve la lista de productos normalizada. """
+    extension = os.path.splitext(ruta)[1].lower()
+    with open(ruta, encoding="utf-8-sig", newline="") as archivo:
+        if extension == ".json":
+            filas = json.load(archivo)
+        elif extension == ".csv":
+            filas = list(csv.DictReader(archivo))
+        else:
+            raise ValueError(f"Formato de menú no soportado: '{extension}'. Use .csv o .json")
+
+    productos = []
+    for numero, fila in enumerate(filas, start=1):
+        try:
+            categoria = str(fila["categoria"]).strip()
+            nombre = str(fila["nombre"]).strip()
+            precio = Dinero.desde_pesos(fila.get("precio") or 0)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Fila {numero} del menú inválida: {e}")
+        if not categoria or not nombre:
+            raise ValueError(f"Fila {numero} del menú sin categoría o nombre.")
+        productos.append({"categoria": categoria, "nombre": nombre, "precio": precio,
+                          "precio_variable": _a_booleano(fila.get("precio_variable", 0))})
+    return productos
+
+
+def importar_menu(gestor, productos):
+    """ Inserta o actualiza categorías y productos en una sola transacción.
+
+    Devuelve un dict con el número de categorias_nuevas, agregados, actualizados y sin_cambios.
+    """
+    resultado = {"categorias_nuevas": 0, "agregados": 0, "actualizados": 0, "sin_cambios": 0}
+    with gestor.transaccion() as cursor:
+        cursor.execute("SELECT nombre, id FROM Categorias")
+        categorias = dict(cursor.fetchall())
+        nuevas = sorted({p["categoria"] for p in productos} - set(categorias))
+        if nuevas:
+            cursor.executemany("INSERT INTO Categorias (nombre) VALUES (?)", [(nombre,) for nombre in nuevas])
+            cursor.execute("SELECT nombre, id FROM Categorias")
+            categorias = dict(cursor.fetchall())
+        resultado["categorias_nuevas"] = len(nuevas)
+
+        cursor.execute("SELECT nombre, precio, id_categoria, precio_variable FROM Productos")
+        existentes = {nombre: (precio, id_cat, bool(variable)) for nombre, precio, id_cat, variable in cursor.fetchall()}
+        cambios = []
+        for p in productos:
+            fila = (p["precio"], categorias[p["categoria"]], p["precio_variable"])
+            anterior = existentes.get(p["nombre"])
+            if anterior is None:
+                resultado["agregados"] += 1
+            elif anterior == fila:
+                resultado["sin_cambios"] += 1
+                continue
+            else:
+                resultado["actualizados"] += 1
+            cambios.append((p["nombre"],) + fila)
+        cursor.executemany("""
+            INSERT INTO Productos (nombre, precio, id_categoria, precio_variable) VALUES (?, ?, ?, ?)
+            ON CONFLICT (nombre) DO UPDATE SET
+                precio = excluded.precio,
+                id_categoria = excluded.id_categoria,
+                precio_variable = excluded.precio_variable
+        """, cambios)
+    return resultado
+
+
+def importar_archivo(gestor, ruta):
+    return importar_menu(gestor, leer_menu(ruta))
+
+
+def exportar_menu(gestor, ruta):
+    """ Escribe el catálogo actual en .csv o .json (según la extensión). Devuelve cuántos productos se exportaron. """
+    filas = gestor.consultar("""
+        SELECT c.nombre, p.nombre, p.precio, p.precio_variable
+        FROM Productos p JOIN Categorias c ON p.id_categoria = c.id
+        ORDER BY c.nombre, p.nombre
+    """)
+    productos = [{"categoria": cat, "nombre": nombre, "precio": float(Dinero(precio).pesos()), "precio_variable": int(bool(variable))}
+                 for cat, nombre, precio, variable in filas]
+    extension = os.path.splitext(ruta)[1].lower()
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        if extension == ".json":
+            json.dump(productos, archivo, ensure_ascii=False, indent=1)
+        elif extension == ".csv":
+            escritor = csv.DictWriter(archivo, fieldnames=COLUMNAS)
+            escritor.writeheader()
+            escritor.writerows(productos)
+        else:
+            raise ValueError(f"Formato de menú no soportado: '{extension}'. Use .csv o .json")
+    return len(productos)
+
+
+def describir_resultado(resultado):
+    return (f"Categorías nuevas: {resultado['categorias_nuevas']}\n"
+            f"Productos agregados: {resultado['agregados']}\n"
+            f"Productos actualizados: {resultado['actualizados']}\n"
+            f"Productos sin cambios: {resultado['sin_cambios']}")
+
+
+class CacheCatalogo:
+    """ Copia en memoria de categorías y productos, indexada por id y por categoría.
+
+    Se recarga si cambió Version_Catalogo. Esa tabla sólo se consulta cuando PRAGMA
+    data_version indica que otra conexión (de este u otro proceso) escribió en la base,
+    así que buscar productos no toca el disco. La caché lee con la conexión de lectura
+    del hilo, no con la del escritor, así que las escrituras de VistaGestion en una base
+    en archivo también cambian data_version: la comprobación es necesaria y basta.
+
+    VistaGestion además llama a invalidar() tras cada cambio como resguardo. Sólo la
+    copia en memoria del modo entrenamiento no tiene conexión aparte de lectura (ver _vigente).
+    """
+
+    def __init__(self, gestor):
+        self.gestor = gestor
+        self.version = None
+        self._data_version = None
+        self.categorias = []
+        self.productos = []
+        self.por_id = {}
+        self.por_categoria = {}
+        self.nombres_categoria = {}
+
+    def invalidar(self):
+        self.version = None
+
+    def _vigente(self):
+        data_version = self.gestor.consultar_uno("PRAGMA data_version")[0]
+        # En una base en memoria la única conexión es la que escribe y data_version no cambia
+        # con sus propias escrituras, así que ahí siempre se compara Version_Catalogo
+        if self.version is not None and data_version == self._data_version and self.gestor.ruta != ":memory:":
+            return
+        self._data_version = data_version
+        version = self.gestor.consultar_uno("SELECT version FROM Version_Catalogo WHERE id = 1")[0]
+        if version != self.version:
+            self._cargar()
+            self.version = version
+
+    def _cargar(self):
+        self.categorias = self.gestor.consultar("SELECT id, nombre FROM Categorias ORDER BY nombre")
+        self.nombres_categoria = dict(self.categorias)
+        self.productos = [Producto(id_prod, nombre, Dinero(precio), variable, id_cat) for id_prod, nombre, precio, variable, id_cat in self.gestor.consultar(
+            "SELECT id, nombre, precio, precio_variable, id_categoria FROM Productos ORDER BY nombre")]
+        self.por_id = {p.id: p for p in self.productos}
+        self.por_categoria = {}
+        for p in self.productos:
+            self.por_categoria.setdefault(p.id_categoria, []).append(p)
+
+    def version_actual(self):
+        self._vigente()
+        return self.version
+
+    def lista_categorias(self):
+        """ [(id, nombre)] ordenadas por nombre. """
+        self._vigente()
+        return self.categorias
+
+    def nombre_categoria(self, id_categoria):
+        self._vigente()
+        return self.nombres_categoria.get(id_categoria)
+
+    def producto(self, id_producto):
+        self._vigente()
+        return self.por_id.get(id_producto)
+
+    def lista_productos(self, id_categoria=None):
+        """ Productos ordenados por nombre, de una categoría o de todas. """
+        self._vigente()
+        if id_categoria:
+            return self.por_categoria.get(id_categoria, [])
+        return self.productos
+
+    def filtrar(self, termino, id_categoria=None):
+        """ Sin término: los productos por nombre. Con término: los que coinciden según el índice FTS, por relevancia. """
+        productos = self.lista_productos(id_categoria)
+        if not consulta_fts(termino):
+            return list(productos)
+        encontrados = (self.por_id.get(id_producto) for id_producto in buscar_productos(self.gestor, termino))
+        return [p for p in encontrados if p and (not id_categoria or p.id_categoria == id_categoria)]
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Consolidación de las ventas de varias sucursales en una base central de reportes.
+
+Cada sucursal tiene su propio pos_database.db. La base central (con el mismo esquema)
+copia de cada una sólo las ventas con id mayor a su marca de agua (Sucursales.ultima_venta)
+y las marca con el nombre de la sucursal. Las ventas que en la sucursal seguían abiertas
+se revisan en cada sincronización para tomar el corte con el que se cerraron.
+
+El corte de un día aparece en la central en cuanto alguna sucursal lo cierra, con los
+totales de las sucursales que ya cerraron; las ventas de las que siguen abiertas
+se suman a él cuando cierran.
+
+Conviene sincronizar con más frecuencia que los días de archivo de las sucursales: las
+ventas que ya se movieron a su archivo anual no se copian.
+
+Uso como script:
+    python consolidacion.py <ruta_central> [sucursal=ruta_db ...]
+Sin sucursales se sincronizan todas las ya registradas.
+"""
+import datetime
+import pathlib
+import sqlite3
+import sys
+import time
+
+from legado import recalcular_cortes
+from reportes import SQL_CORTE_DE_VENTA
+
+SQL_VENTAS_NUEVAS = f"""
+    SELECT v.id, v.id_mesa, v.total, v.metodo_pago, v.descuento, v.paga_con,
+           NULLIF({SQL_CORTE_DE_VENTA}, ''), v.fecha_hora, v.fecha_negocio, v.fecha_epoch
+    FROM Ventas v WHERE v.id > ? ORDER BY v.id LIMIT ?
+"""
+
+
+def lista_sucursales(gestor):
+    return [fila[0] for fila in gestor.consultar("SELECT sucursal FROM Sucursales ORDER BY sucursal")]
+
+
+def _id_producto(cursor, productos, nombre, categoria, precio):
+    # Los ids de producto de cada sucursal no coinciden; en la central se emparejan por nombre
+    if nombre not in productos:
+        id_categoria = None
+        if categoria:
+            cursor.execute("INSERT OR IGNORE INTO Categorias (nombre) VALUES (?)", (categoria,))
+            cursor.execute("SELECT id FROM Categorias WHERE nombre = ?", (categoria,))
+            id_categoria = cursor.fetchone()[0]
+        cursor.execute("INSERT OR IGNORE INTO Productos (nombre, precio, id_categoria) VALUES (?, ?, ?)", (nombre, precio, id_categoria))
+        cursor.execute("SELECT id FROM Productos WHERE nombre = ?", (nombre,))
+        productos[nombre] = cursor.fetchone()[0]
+    return productos[nombre]
+
+
+def _actualizar_abiertas(gestor, fuente, sucursal, cortes):
+    # Ventas que estaban abiertas en la sucursal en la sincronización anterior
+    abiertas = gestor.consultar("""
+        SELECT i.id_origen, i.id_venta FROM Ventas v JOIN Ventas_Importadas i ON i.id_venta = v.id AND i.origen = v.sucursal
+        WHERE v.sucursal = ? AND v.corte_id IS NULL
+    """, (sucursal,))
+    cerradas = []
+    for id_origen, id_venta in abiertas:
+        fila = fuente.execute(f"SELECT NULLIF({SQL_CORTE_DE_VENTA}, '') FROM Ventas v WHERE v.id = ?", (id_origen,)).fetchone()
+        if fila and fila[0]:
+            cerradas.append((fila[0], id_venta))
+    if cerradas:
+        # Los triggers mueven sus totales de la fila abierta a la del corte
+        with gestor.transaccion() as cursor:
+            cursor.executemany("UPDATE Ventas SET corte_id = ? WHERE id = ?", cerradas)
+        cortes.update(corte_id for corte_id, _ in cerradas)
+    return len(cerradas)
+
+
+def _crear_cortes(cursor, cortes):
+    # En la central toda venta cerrada trae el corte_id de su sucursal, así que el corte se crea
+    # aunque otra sucursal siga con el día abierto. Mientras tanto su rango queda vacío
+    # (desde > hasta) para que SQL_CORTE_DE_VENTA no tome como suyas las ventas abiertas
+    # cuyos ids caen entre las cerradas; cuando ya no queda ninguna se fija el rango real.
+    for corte_id in sorted(cortes):
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM Resumen_Diario WHERE fecha_negocio = ? AND corte_id = '' AND num_tickets > 0)",
+                       (corte_id,))
+        abierto = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO Cortes (corte_id, fecha_negocio, id_venta_desde, id_venta_hasta, abierto_en, cerrado_en)
+            SELECT ?, ?, CASE WHEN ? THEN 0 ELSE MIN(id) END, CASE WHEN ? THEN -1 ELSE MAX(id) END, MIN(fecha_hora), MAX(fecha_hora)
+            FROM Ventas WHERE corte_id = ?
+            ON CONFLICT (corte_id) DO UPDATE SET
+                id_venta_desde = excluded.id_venta_desde,
+                id_venta_hasta = excluded.id_venta_hasta,
+                abierto_en = excluded.abierto_en,
+                cerrado_en = excluded.cerrado_en
+        """, (corte_id, corte_id, abierto, abierto, corte_id))
+
+
+def sincronizar_sucursal(gestor, sucursal, ruta, lote=1000):
+    """ Copia a la base central las ventas nuevas de una sucursal. Devuelve un dict con ventas, lineas y cerradas. """
+    fuente = sqlite3.connect(pathlib.Path(ruta).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        if "linea" not in {fila[1] for fila in fuente.execute("PRAGMA table_info(Detalle_Venta)")}:
+            raise ValueError(f"La base de '{sucursal}' tiene un esquema anterior; ábrala una vez con la App para actualizarla.")
+        with gestor.transaccion() as cursor:
+            cursor.execute("INSERT INTO Sucursales (sucursal, ruta) VALUES (?, ?) ON CONFLICT (sucursal) DO UPDATE SET ruta = excluded.ruta", (sucursal, ruta))
+            cursor.execute("SELECT ultima_venta FROM Sucursales WHERE sucursal = ?", (sucursal,))
+            ultima = cursor.fetchone()[0]
+            cursor.execute("SELECT nombre, id FROM Productos")
+            productos = dict(cursor.fetchall())
+
+        cortes = set()
+        resultado = {"ventas": 0, "lineas": 0, "cerradas": _actualizar_abiertas(gestor, fuente, sucursal, cortes)}
+        inicio = time.monotonic()
+        while True:
+            ventas = fuente.execute(SQL_VENTAS_NUEVAS, (ultima, lote)).fetchall()
+            if not ventas:
+                break
+            desde, ultima = ventas[0][0], ventas[-1][0]
+            lineas = {}
+            for fila in fuente.execute(
+                    "SELECT id_venta, nombre, categoria, cantidad, precio_unitario FROM Detalle_Venta WHERE id_venta BETWEEN ? AND ? ORDER BY id_venta, linea",
+                    (desde, ultima)):
+                lineas.setdefault(fila[0], []).append(fila[1:])
+
+            # Las ventas del lote y la nueva marca de agua se confirman juntas
+            with gestor.transaccion() as cursor:
+                for id_origen, *venta, corte_id, fecha_hora, fecha, epoch in ventas:
+                    cursor.execute(
+                        "INSERT INTO Ventas (id_mesa, total, metodo_pago, descuento, paga_con, corte_id, fecha_hora, fecha_negocio, fecha_epoch, sucursal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*venta, corte_id, fecha_hora, fecha, epoch, sucursal))
+                    id_venta = cursor.lastrowid
+                    detalle = [(id_venta, numero, _id_producto(cursor, productos, nombre, categoria, precio), nombre, categoria, cantidad, precio)
+                               for numero, (nombre, categoria, cantidad, precio) in enumerate(lineas.get(id_origen, []), start=1)]
+                    cursor.executemany(
+                        "INSERT INTO Detalle_Venta (id_venta, linea, id_producto, nombre, categoria, cantidad, precio_unitario) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        detalle)
+                    cursor.execute("INSERT INTO Ventas_Importadas (origen, id_origen, id_venta) VALUES (?, ?, ?)", (sucursal, id_origen, id_venta))
+                    resultado["ventas"] += 1
+                    resultado["lineas"] += len(detalle)
+                    if corte_id:
+                        cortes.add(corte_id)
+                cursor.execute("UPDATE Sucursales SET ultima_venta = ?, sincronizado_en = ? WHERE sucursal = ?",
+                               (ultima, datetime.datetime.now(), sucursal))
+            print(f"{sucursal}: {resultado['ventas']} ventas nuevas (hasta id {ultima}) - "
+                  f"{resultado['ventas'] / max(time.monotonic() - inicio, 0.001):.0f} ventas/s")
+
+        if cortes:
+            with gestor.transaccion() as cursor:
+                _crear_cortes(cursor, cortes)
+                # Con la fila ya creada, sólo recalcula los totales desde Resumen_Diario
+                recalcular_cortes(cursor, cortes)
+    finally:
+        fuente.close()
+    return resultado
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    gestor = GestorBD(sys.argv[1])
+    aplicar_migraciones(gestor)
+    sucursales = [argumento.split("=", 1) for argumento in sys.argv[2:]]
+    if not sucursales:
+        sucursales = gestor.consultar("SELECT sucursal, ruta FROM Sucursales ORDER BY sucursal")
+    for sucursal, ruta in sucursales:
+        resultado = sincronizar_sucursal(gestor, sucursal, ruta)
+        print(f"{sucursal}: {resultado['ventas']} ventas ({resultado['lineas']} líneas) copiadas, {resultado['cerradas']} cerradas desde la última vez.")
+    gestor.cerrar()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Importes en centavos enteros.
+
+La base guarda precios y totales como INTEGER (centavos), así que las sumas de los
+reportes son exactas. Dinero es un int que se muestra en pesos.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+class Dinero(int):
+    """ Importe en centavos: f"{Dinero(1250):.2f}" -> '12.50'.
+
+    Sumar, restar o multiplicar por una cantidad entera devuelve otro Dinero.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def desde_pesos(cls, valor):
+        """ Convierte pesos ('12.5', 12.5, Decimal) a centavos, redondeando al centavo. """
+        try:
+            pesos = Decimal(str(valor).strip() or "0")
+        except InvalidOperation:
+            raise ValueError(f"Importe inválido: '{valor}'")
+        if not pesos.is_finite():
+            raise ValueError(f"Importe inválido: '{valor}'")
+        return cls((pesos * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def pesos(self):
+        return Decimal(int(self)).scaleb(-2)
+
+    def __format__(self, formato):
+        return format(self.pesos(), formato or ".2f")
+
+    def __str__(self):
+        return format(self)
+
+    def __repr__(self):
+        return f"Dinero({int(self)})"
+
+    def __add__(self, otro):
+        return Dinero(int(self) + otro) if isinstance(otro, int) else NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, otro):
+        return Dinero(int(self) - otro) if isinstance(otro, int) else NotImplemented
+
+    def __rsub__(self, otro):
+        return Dinero(otro - int(self)) if isinstance(otro, int) else NotImplemented
+
+    def __mul__(self, cantidad):
+        return Dinero(int(self) * cantidad) if isinstance(cantidad, int) else NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Dinero(-int(self))
+
+    def __abs__(self):
+        return Dinero(abs(int(self)))
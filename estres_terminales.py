@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Prueba de carga: varias terminales (procesos) registrando ventas a la vez en la misma base.
+
+Cada proceso abre su propio GestorBD y guarda ventas una por una, cada una en su
+transacción, durante los segundos indicados. Al final se revisa en la base que cada
+venta confirmada esté guardada con su terminal, es decir, que no se perdió ninguna.
+
+Uso como script:
+    python estres_terminales.py [terminales] [segundos] [ruta_db]
+Sin ruta_db se usa una base temporal nueva. Las ventas de prueba se quedan guardadas:
+no la use con la base de producción.
+"""
+import datetime
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from base_datos import GestorBD
+from migraciones import aplicar_migraciones
+from ventas import insertar_venta
+
+LINEAS_DE_PRUEBA = [(0, "Producto de prueba", "Prueba", 2, 2500), (0, "Refresco de prueba", "Prueba", 1, 1500)]
+
+
+def _simular_terminal(ruta, terminal, segundos, resultados):
+    gestor = GestorBD(ruta)
+    confirmadas, fallidas, espera_maxima = [], 0, 0.0
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        inicio = time.monotonic()
+        try:
+            with gestor.transaccion() as cursor:
+                id_venta = insertar_venta(cursor, "Prueba", 6500, "Efectivo", 0, 10000, LINEAS_DE_PRUEBA,
+                                          datetime.datetime.now(), terminal=terminal)
+        except sqlite3.Error as e:
+            fallidas += 1
+            print(f"ERROR: {terminal} no pudo guardar una venta: {e}")
+        else:
+            confirmadas.append(id_venta)
+        espera_maxima = max(espera_maxima, time.monotonic() - inicio)
+    gestor.cerrar()
+    resultados.put((terminal, confirmadas, fallidas, espera_maxima))
+
+
+def probar_terminales(ruta, terminales=4, segundos=10):
+    """ Corre la prueba y devuelve un dict con ventas, fallidas, perdidas y ventas_por_segundo. """
+    gestor = GestorBD(ruta)
+    aplicar_migraciones(gestor)
+    resultados = multiprocessing.Queue()
+    procesos = [multiprocessing.Process(target=_simular_terminal, args=(ruta, f"prueba-{numero}", segundos, resultados))
+                for numero in range(1, terminales + 1)]
+    inicio = time.monotonic()
+    for proceso in procesos:
+        proceso.start()
+    # Se leen los resultados antes del join: un proceso no termina mientras su cola tenga datos sin leer
+    por_terminal = [resultados.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+    duracion = time.monotonic() - inicio
+
+    resumen = {"ventas": 0, "fallidas": 0, "perdidas": 0}
+    for terminal, confirmadas, fallidas, espera_maxima in sorted(por_terminal):
+        guardadas = {fila[0] for fila in gestor.consultar("SELECT id FROM Ventas WHERE terminal = ?", (terminal,))}
+        perdidas = len(set(confirmadas) - guardadas)
+        print(f"{terminal}: {len(confirmadas)} ventas, {fallidas} fallidas, {perdidas} perdidas, "
+              f"espera máxima {espera_maxima * 1000:.0f} ms")
+        resumen["ventas"] += len(confirmadas)
+        resumen["fallidas"] += fallidas
+        resumen["perdidas"] += perdidas
+    gestor.cerrar()
+    resumen["ventas_por_segundo"] = resumen["ventas"] / duracion
+    return resumen
+
+
+if __name__ == "__main__":
+    terminales = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    if len(sys.argv) > 3:
+        ruta = sys.argv[3]
+    else:
+        ruta = os.path.join(tempfile.mkdtemp(prefix="pos_estres_"), "pos_database.db")
+        print(f"Base temporal: {ruta}")
+    resumen = probar_terminales(ruta, terminales, segundos)
+    print(f"Total: {resumen['ventas']} ventas en {segundos:g} s con {terminales} terminales "
+          f"({resumen['ventas_por_segundo']:.0f} ventas/s), {resumen['fallidas']} fallidas, {resumen['perdidas']} perdidas")
+    sys.exit(1 if resumen["fallidas"] or resumen["perdidas"] else 0)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Importa las ventas de una base del sistema anterior (Punto_De_Venta/pos_database.db).
+
+Las ventas se leen por lotes de tamaño fijo, así que una base de varios años se
+importa con memoria constante. Los productos y categorías se emparejan por nombre
+(los que no existen se crean), los importes se pasan a centavos y cada venta queda
+registrada en Ventas_Importadas para que repetir la importación no la duplique.
+
+Las ventas sin corte_id de días anteriores a hoy se asignan al corte de su día
+contable. Las de hoy, y las de cualquier día que en esta base aún tenga ventas sin
+cerrar, se importan abiertas para que las tome el siguiente cierre de caja.
+
+Uso como script:
+    python legado.py <ruta_base_anterior> [ruta_db] [ventas_por_lote]
+"""
+import datetime
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+from dinero import Dinero
+from ventas import fecha_negocio
+
+
+def _columnas(conn, tabla):
+    return {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+
+
+def _columna(columnas, nombre, defecto="NULL"):
+    # Las bases más antiguas no tienen todas las columnas
+    return nombre if nombre in columnas else f"{defecto} AS {nombre}"
+
+
+def _importar_catalogo(fuente, cursor):
+    """ Crea las categorías y productos que falten y devuelve
+    {id_producto_anterior: (id_producto_actual, nombre, categoria)}.
+    """
+    categorias = dict(fuente.execute("SELECT id, nombre FROM Categorias"))
+    cursor.executemany("INSERT OR IGNORE INTO Categorias (nombre) VALUES (?)", [(nombre,) for nombre in categorias.values()])
+    cursor.execute("SELECT nombre, id FROM Categorias")
+    ids_categoria = dict(cursor.fetchall())
+
+    variable = _columna(_columnas(fuente, "Productos"), "precio_variable", "0")
+    productos = fuente.execute(f"SELECT id, nombre, precio, id_categoria, {variable} FROM Productos").fetchall()
+    # Los productos que ya existen conservan su precio y categoría actuales
+    cursor.executemany(
+        "INSERT OR IGNORE INTO Productos (nombre, precio, id_categoria, precio_variable) VALUES (?, ?, ?, ?)",
+        [(nombre, Dinero.desde_pesos(precio or 0), ids_categoria.get(categorias.get(id_cat)), bool(es_variable))
+         for _, nombre, precio, id_cat, es_variable in productos])
+    cursor.execute("SELECT nombre, id FROM Productos")
+    ids_producto = dict(cursor.fetchall())
+    return {id_anterior: (ids_producto[nombre], nombre, categorias.get(id_cat))
+            for id_anterior, nombre, _, id_cat, _ in productos}
+
+
+def _momento(fecha_hora, corte_id, hora_corte):
+    # Sin fecha_hora válida se toma el inicio del día contable de su corte; sin ninguno de los dos, None
+    for valor, horas in ((fecha_hora, 0), (corte_id, hora_corte)):
+        try:
+            return datetime.datetime.fromisoformat(str(valor)) + datetime.timedelta(hours=horas)
+        except ValueError:
+            pass
+    return None
+
+
+def recalcular_cortes(cursor, cortes):
+    # Los totales del corte salen de Resumen_Diario, que ya incluye las ventas importadas;
+    # el rango de ids de un corte existente no se toca (las importadas llevan su corte_id).
+    # Un día con ventas aún abiertas no recibe un rango: lo crea su cierre de caja normal.
+    for corte_id in sorted(cortes):
+        cursor.execute("""
+            INSERT INTO Cortes (corte_id, fecha_negocio, id_venta_desde, id_venta_hasta, abierto_en, cerrado_en)
+            SELECT ?, ?, MIN(id), MAX(id), MIN(fecha_hora), MAX(fecha_hora) FROM Ventas WHERE corte_id = ?
+            GROUP BY corte_id HAVING NOT EXISTS (SELECT 1 FROM Resumen_Diario WHERE fecha_negocio = ? AND corte_id = '' AND num_tickets > 0)
+            ON CONFLICT (corte_id) DO NOTHING
+        """, (corte_id, corte_id, corte_id, corte_id))
+        cursor.execute("""
+            UPDATE Cortes SET (num_tickets, total, total_efectivo, total_tarjeta, total_descuento) =
+                (SELECT SUM(num_tickets), SUM(total), SUM(total_efectivo), SUM(total_tarjeta), SUM(total_descuento)
+                 FROM Resumen_Diario WHERE corte_id = ?)
+            WHERE corte_id = ?
+        """, (corte_id, corte_id))
+
+
+def importar_legado(gestor, ruta, origen=None, lote=500, hora_corte=0, hoy=None):
+    """ Importa categorías, productos y ventas de la base anterior en `ruta`.
+
+    Devuelve un dict con ventas, lineas, duplicadas (ya importadas antes), omitidas
+    (de cortes que en esta base ya se movieron al archivo anual) y sin_fecha (sin fecha ni corte).
+    """
+    origen = origen or os.path.basename(ruta)
+    hoy = hoy or fecha_negocio(datetime.datetime.now(), hora_corte)
+    fuente = sqlite3.connect(pathlib.Path(ruta).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        with gestor.transaccion() as cursor:
+            productos = _importar_catalogo(fuente, cursor)
+            cursor.execute("SELECT corte_id FROM Cortes WHERE archivo IS NOT NULL")
+            archivados = {fila[0] for fila in cursor.fetchall()}
+            # Días que en esta base todavía tienen ventas sin cerrar
+            cursor.execute("SELECT fecha_negocio FROM Resumen_Diario WHERE corte_id = '' AND num_tickets > 0")
+            dias_abiertos = {fila[0] for fila in cursor.fetchall()}
+
+        columnas = _columnas(fuente, "Ventas")
+        sql_ventas = f"""
+            SELECT id, id_mesa, total, {_columna(columnas, 'metodo_pago')}, {_columna(columnas, 'descuento', '0')},
+                   {_columna(columnas, 'paga_con', '0')}, {_columna(columnas, 'corte_id')}, fecha_hora
+            FROM Ventas WHERE id > ? ORDER BY id LIMIT ?"""
+        resultado = {"ventas": 0, "lineas": 0, "duplicadas": 0, "omitidas": 0, "sin_fecha": 0}
+        cortes = set()
+        ultimo = 0
+        inicio = time.monotonic()
+        while True:
+            ventas = fuente.execute(sql_ventas, (ultimo, lote)).fetchall()
+            if not ventas:
+                break
+            desde, ultimo = ventas[0][0], ventas[-1][0]
+            lineas = {}
+            for id_venta, id_producto, cantidad, precio in fuente.execute(
+                    "SELECT id_venta, id_producto, cantidad, precio_unitario FROM Detalle_Venta WHERE id_venta BETWEEN ? AND ? ORDER BY id_venta, id",
+                    (desde, ultimo)):
+                lineas.setdefault(id_venta, []).append((id_producto, cantidad, precio))
+
+            with gestor.transaccion() as cursor:
+                cursor.execute("SELECT id_origen FROM Ventas_Importadas WHERE origen = ? AND id_origen BETWEEN ? AND ?", (origen, desde, ultimo))
+                importadas = {fila[0] for fila in cursor.fetchall()}
+                for id_origen, id_mesa, total, metodo_pago, descuento, paga_con, corte_id, fecha_hora in ventas:
+                    if id_origen in importadas:
+                        resultado["duplicadas"] += 1
+                        continue
+                    momento = _momento(fecha_hora, corte_id, hora_corte)
+                    if momento is None:
+                        print(f"ADVERTENCIA: La venta {id_origen} de '{origen}' no tiene fecha ni corte; no se importa.")
+                        resultado["sin_fecha"] += 1
+                        continue
+                    # El sistema anterior cerraba por DATE(fecha_hora); ese día es el corte
+                    fecha = corte_id or fecha_negocio(momento, hora_corte)
+                    if fecha >= hoy or fecha in dias_abiertos:
+                        corte_id = None
+                        dias_abiertos.add(fecha)
+                    elif corte_id is None:
+                        corte_id = fecha
+                    if corte_id in archivados:
+                        resultado["omitidas"] += 1
+                        continue
+                    cursor.execute(
+                        "INSERT INTO Ventas (id_mesa, total, metodo_pago, descuento, paga_con, corte_id, fecha_hora, fecha_negocio, fecha_epoch) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (id_mesa, Dinero.desde_pesos(total), metodo_pago, Dinero.desde_pesos(descuento or 0), Dinero.desde_pesos(paga_con or 0),
+                         corte_id, momento, fecha, int(momento.timestamp())))
+                    id_venta = cursor.lastrowid
+                    detalle = []
+                    for numero, (id_producto, cantidad, precio) in enumerate(lineas.get(id_origen, []), start=1):
+                        # Productos borrados del catálogo anterior: id negativo para no mezclarlos con los actuales
+                        id_actual, nombre, categoria = productos.get(id_producto, (-(id_producto or 0), f"Producto #{id_producto}", None))
+                        detalle.append((id_venta, numero, id_actual, nombre, categoria, cantidad, Dinero.desde_pesos(precio)))
+                    cursor.executemany(
+                        "INSERT INTO Detalle_Venta (id_venta, linea, id_producto, nombre, categoria, cantidad, precio_unitario) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        detalle)
+                    cursor.execute("INSERT INTO Ventas_Importadas (origen, id_origen, id_venta) VALUES (?, ?, ?)", (origen, id_origen, id_venta))
+                    resultado["ventas"] += 1
+                    resultado["lineas"] += len(detalle)
+                    if corte_id:
+                        cortes.add(corte_id)
+
+            segundos = time.monotonic() - inicio
+            procesadas = resultado["ventas"] + resultado["duplicadas"] + resultado["omitidas"] + resultado["sin_fecha"]
+            print(f"Ventas procesadas: {procesadas} (hasta id {ultimo}) - {procesadas / max(segundos, 0.001):.0f} ventas/s")
+
+        with gestor.transaccion() as cursor:
+            recalcular_cortes(cursor, cortes)
+    finally:
+        fuente.close()
+    return resultado
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    gestor = GestorBD(sys.argv[2] if len(sys.argv) > 2 else "pos_database.db")
+    aplicar_migraciones(gestor)
+    resultado = importar_legado(gestor, sys.argv[1], lote=int(sys.argv[3]) if len(sys.argv) > 3 else 500)
+    print(f"Ventas importadas: {resultado['ventas']} ({resultado['lineas']} líneas), "
+          f"ya importadas antes: {resultado['duplicadas']}, de cortes archivados: {resultado['omitidas']}, "
+          f"sin fecha: {resultado['sin_fecha']}")
+    gestor.cerrar()
@@ -1,13 +1,30 @@
 # -*- coding: utf-8 -*-
 import sqlite3
 import os
+import socket
 import sys
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog, font
+from tkinter import ttk, messagebox, simpledialog, font, filedialog
 from functools import partial
 import datetime
+import time
 import configparser
 
+# Referencia para medir el tiempo hasta la primera pantalla
+INICIO_ARRANQUE = time.perf_counter()
+
+from base_datos import GestorBD, es_bloqueo
+from migraciones import aplicar_migraciones
+from ventas import fecha_negocio, EscritorVentas
+from reportes import resumen_del_dia, resumen_de_corte, productos_del_dia, productos_de_corte, lista_cortes, cerrar_corte
+from archivo import archivar_cortes_antiguos, actualizar_archivos
+from respaldo import ServicioRespaldo
+from mantenimiento import ServicioMantenimiento
+from consolidacion import lista_sucursales
+from replica import ServicioReplica, es_replica
+from dinero import Dinero
+from catalogo import importar_archivo, exportar_menu, describir_resultado, CacheCatalogo
+
 def resource_path(relative_path):
     """ Obtiene la ruta absoluta a un recurso, funciona para desarrollo y para PyInstaller """
     try:
@@ -87,6 +104,45 @@ else:
 # La ruta de la base de datos ahora es siempre externa al .exe
 DB_FILE = os.path.join(application_path, config.get('Database', 'file', fallback='pos_database.db'))
 
+# Archivos anuales con las ventas de cortes antiguos (0 días = no archivar)
+CARPETA_ARCHIVO = os.path.join(application_path, config.get('Archive', 'folder', fallback='archivo'))
+try:
+    DIAS_ARCHIVO = config.getint('Archive', 'days', fallback=365)
+except ValueError:
+    DIAS_ARCHIVO = 365
+
+# Respaldos en línea: se hacen al cerrar caja y cada `interval_min` minutos (0 = sólo al cerrar)
+CARPETA_RESPALDOS = os.path.join(application_path, config.get('Backup', 'folder', fallback='respaldos'))
+try:
+    RESPALDOS_A_CONSERVAR = config.getint('Backup', 'keep', fallback=7)
+    PAGINAS_POR_PASO_RESPALDO = config.getint('Backup', 'pages_per_step', fallback=256)
+    PAUSA_RESPALDO = config.getint('Backup', 'pause_ms', fallback=50) / 1000
+    INTERVALO_RESPALDO = config.getint('Backup', 'interval_min', fallback=0) * 60
+except ValueError:
+    RESPALDOS_A_CONSERVAR, PAGINAS_POR_PASO_RESPALDO, PAUSA_RESPALDO, INTERVALO_RESPALDO = 7, 256, 0.05, 0
+
+# Mantenimiento (optimize, analyze, checkpoint, vacuum) tras el cierre o con la App inactiva en mesas
+try:
+    PRESUPUESTO_MANTENIMIENTO = config.getfloat('Maintenance', 'budget_s', fallback=2.0)
+    MINUTOS_INACTIVIDAD = config.getfloat('Maintenance', 'idle_min', fallback=10)
+except ValueError:
+    PRESUPUESTO_MANTENIMIENTO, MINUTOS_INACTIVIDAD = 2.0, 10
+
+# Base en espera en otro disco o memoria USB, al día cada `interval_s` segundos (vacío = sin base en espera)
+ARCHIVO_REPLICA = config.get('Standby', 'file', fallback='').strip()
+RUTA_REPLICA = os.path.join(application_path, ARCHIVO_REPLICA) if ARCHIVO_REPLICA else None
+try:
+    INTERVALO_REPLICA = config.getfloat('Standby', 'interval_s', fallback=5)
+except ValueError:
+    INTERVALO_REPLICA = 5
+
+# Las vistas se construyen al usarlas por primera vez; con prewarm_views las demás se construyen
+# poco a poco después de mostrar las mesas
+try:
+    PRECARGAR_VISTAS = config.getboolean('Startup', 'prewarm_views', fallback=True)
+except ValueError:
+    PRECARGAR_VISTAS = True
+
 # Los otros assets (imágenes, etc.) sí se buscan dentro del .exe
 ASSETS_PATH = resource_path("assets")
 # --- FIN DE LA CORRECCIÓN ---
@@ -107,11 +163,50 @@ except (ValueError, configparser.NoSectionError, configparser.NoOptionError):
     ID_VENDOR = 0x0
     ID_PRODUCT = 0x0
 
+# Hora (0-23) en que empieza el día contable: lo vendido en la madrugada cuenta para el día anterior
+try:
+    HORA_CORTE_DIA = config.getint('Business', 'day_cutoff_hour', fallback=0)
+except ValueError:
+    HORA_CORTE_DIA = 0
+
+# Nombre de esta caja cuando varias terminales comparten el mismo archivo de base de datos
+TERMINAL = config.get('Terminal', 'id', fallback='').strip() or socket.gethostname()
+
+# Espera (busy_timeout) y reintentos cuando otra terminal está escribiendo en la base
+try:
+    ESPERA_BD_MS = config.getint('Database', 'busy_timeout_ms', fallback=5000)
+    REINTENTOS_BD = config.getint('Database', 'write_retries', fallback=5)
+except ValueError:
+    ESPERA_BD_MS, REINTENTOS_BD = 5000, 5
+
+# Conexiones a la base de datos abiertas una sola vez para toda la vida de la App
+gestor_db = GestorBD(
+    DB_FILE,
+    cache_kb=config.getint('Database', 'cache_kb', fallback=8192),
+    mmap_mb=config.getint('Database', 'mmap_mb', fallback=64),
+    espera_ms=ESPERA_BD_MS,
+    reintentos=REINTENTOS_BD,
+)
+# Los reportes leen por una conexión de sólo lectura aparte, sin competir con el guardado de ventas
+gestor_reportes = GestorBD(
+    DB_FILE,
+    cache_kb=config.getint('Database', 'cache_kb', fallback=8192),
+    mmap_mb=config.getint('Database', 'mmap_mb', fallback=64),
+    solo_lectura=True,
+    espera_ms=ESPERA_BD_MS,
+)
+# Catálogo en memoria; se recarga solo cuando cambian Categorias o Productos
+cache_catalogo = CacheCatalogo(gestor_db)
+# En modo entrenamiento los tres anteriores apuntan a una copia en memoria de la base
+modo_entrenamiento = False
+
 # --- FUNCIONES AUXILIARES ---
-def conectar_db():
-    return sqlite3.connect(DB_FILE)
 
 def imprimir_ticket_fisico(texto_del_ticket, con_logo=True):
+    if modo_entrenamiento:
+        # En entrenamiento nada sale por la impresora: el ticket se muestra en pantalla
+        VistaPreviaImpresion(texto_del_ticket)
+        return True
     p = None
     try:
         if ID_VENDOR == 0x0 or ID_PRODUCT == 0x0:
@@ -160,22 +255,20 @@ def formatear_cuenta_cliente(orden):
     return texto
 
 def formatear_recibo_final(id_venta):
-    conn = conectar_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_mesa, total, metodo_pago, descuento, paga_con, fecha_hora FROM Ventas WHERE id = ?", (id_venta,))
-    venta = cursor.fetchone()
+    venta = gestor_db.consultar_uno("SELECT id_mesa, total, metodo_pago, descuento, paga_con, fecha_hora FROM Ventas WHERE id = ?", (id_venta,))
     if not venta: return "ERROR: Venta no encontrada"
-    id_mesa_o_texto, total, metodo_pago, descuento, paga_con, fecha_hora = venta
-    cursor.execute("SELECT dv.cantidad, dv.precio_unitario, p.nombre FROM Detalle_Venta dv JOIN Productos p ON dv.id_producto = p.id WHERE dv.id_venta = ?", (id_venta,))
-    detalles = cursor.fetchall()
-    conn.close()
+    id_mesa_o_texto, fecha_hora = venta[0], venta[5]
+    total, descuento, paga_con = Dinero(venta[1]), Dinero(venta[3] or 0), Dinero(venta[4] or 0)
+    metodo_pago = venta[2]
+    detalles = gestor_db.consultar("SELECT cantidad, precio_unitario, nombre FROM Detalle_Venta WHERE id_venta = ? ORDER BY linea", (id_venta,))
     fecha_str = datetime.datetime.fromisoformat(fecha_hora).strftime("%d/%m/%Y %I:%M %p")
     identificador_mesa = f"Mesa: {id_mesa_o_texto}" if str(id_mesa_o_texto).isdigit() else id_mesa_o_texto
     texto = f"{INFO_NEGOCIO['nombre']}\n{INFO_NEGOCIO['direccion']}\nTel: {INFO_NEGOCIO['telefono']}\n"
     texto += "=" * 30 + f"\nTicket: {id_venta:05d}   {identificador_mesa}\nFecha: {fecha_str}\n"
     texto += "-" * 30 + "\nCant  Descripción        P.U.   Total\n" + "-" * 30 + "\n"
-    subtotal = 0
+    subtotal = Dinero(0)
     for cant, pu, nombre in detalles:
+        pu = Dinero(pu)
         total_linea = cant * pu
         subtotal += total_linea
         nombre_corto = (nombre[:18] + '..') if len(nombre) > 20 else nombre
@@ -259,6 +352,23 @@ class ReporteProductosDialog(tk.Toplevel):
         self.geometry(f"+{x}+{y}")
 
 
+class VistaPreviaImpresion(tk.Toplevel):
+    """ Ticket mostrado en pantalla en lugar de enviarse a la impresora (modo entrenamiento). """
+    def __init__(self, contenido):
+        super().__init__()
+        self.title("Vista Previa de Impresión - Entrenamiento")
+        self.geometry("420x600")
+        self.config(bg=Theme.COLOR_FONDO_SECUNDARIO)
+        self.transient(self.master)
+
+        text_widget = tk.Text(self, font=Theme.FONT_TICKET, wrap="none", state="normal", bg=Theme.COLOR_FONDO_SECUNDARIO, relief="flat", bd=0)
+        text_widget.pack(expand=True, fill="both", padx=15, pady=15)
+        text_widget.insert("1.0", contenido)
+        text_widget.config(state="disabled")
+        tk.Button(self, text="Cerrar", font=Theme.FONT_BOTON, relief="flat", command=self.destroy).pack(pady=10, ipady=5)
+        self.lift()
+
+
 class VistaMesas(tk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent, bg=Theme.COLOR_FONDO_PRINCIPAL)
@@ -275,6 +385,8 @@ class VistaMesas(tk.Frame):
         frame_botones_accion.pack(side='right', padx=20)
         tk.Button(frame_botones_accion, text="⚙️ Gestionar Menú", font=Theme.FONT_BOTON, command=lambda: controller.mostrar_vista(VistaGestion)).pack(pady=5, ipady=5)
         tk.Button(frame_botones_accion, text="📊 Corte de Caja", font=Theme.FONT_BOTON, command=lambda: controller.mostrar_vista(VistaReporte)).pack(pady=5, ipady=5)
+        self.boton_entrenamiento = tk.Button(frame_botones_accion, text="🎓 Modo Entrenamiento", font=Theme.FONT_BOTON, command=controller.alternar_entrenamiento)
+        self.boton_entrenamiento.pack(pady=5, ipady=5)
         
         main_content_frame = tk.Frame(self, bg=Theme.COLOR_FONDO_PRINCIPAL)
         main_content_frame.pack(pady=20, expand=True, fill='both')
@@ -330,10 +442,23 @@ class VistaMesas(tk.Frame):
         self.actualizar_colores()
 
 class VistaPedido(tk.Frame):
+    # Tamaño en píxeles de cada mosaico de producto en la cuadrícula (incluye el margen)
+    ANCHO_MOSAICO = 200
+    ALTO_MOSAICO = 110
+    MARGEN_MOSAICO = 5
+
     def __init__(self, parent, controller):
         super().__init__(parent, bg=Theme.COLOR_FONDO_PRINCIPAL)
         self.controller = controller
         self.current_products = []
+        self.importes_ticket = {}
+        self.id_categoria_actual = None
+        # Caché y versión del catálogo con que se construyó la barra de categorías
+        self.version_categorias = None
+        # Mosaicos dibujados en el Canvas: índice del producto -> (rectángulo, texto); los libres se reutilizan
+        self.mosaicos = {}
+        self.mosaicos_libres = []
+        self.num_cols = 1
 
         # Columna de Categorías con Scroll
         col_categorias_main = tk.Frame(self, width=200, bg=Theme.COLOR_FONDO_SECUNDARIO)
@@ -361,11 +486,6 @@ class VistaPedido(tk.Frame):
         self.frame_productos = tk.Frame(col_derecha, bg=Theme.COLOR_FONDO_SECUNDARIO)
         self.frame_productos.grid(row=1, column=0, sticky="nsew", pady=(5,0))
         
-        style = ttk.Style()
-        style.configure("Custom.Treeview", rowheight=35, font=Theme.FONT_NORMAL, background=Theme.COLOR_FONDO_SECUNDARIO, foreground=Theme.COLOR_TEXTO_PRINCIPAL, fieldbackground=Theme.COLOR_FONDO_SECUNDARIO)
-        style.map("Custom.Treeview", background=[('selected', Theme.COLOR_ACCENT_PRIMARY)])
-        style.configure("Custom.Treeview.Heading", font=Theme.FONT_BOTON, background="#EAECEE", foreground=Theme.COLOR_TEXTO_PRINCIPAL)
-        
         self.label_titulo_ticket = tk.Label(frame_superior, font=Theme.FONT_TITULO, bg=Theme.COLOR_FONDO_CABECERA, fg=Theme.COLOR_TEXTO_CABECERA)
         self.label_titulo_ticket.pack(pady=10)
         
@@ -406,22 +526,25 @@ class VistaPedido(tk.Frame):
         search_entry = tk.Entry(frame_busqueda, textvariable=self.search_var, font=Theme.FONT_NORMAL, relief="solid", bd=1)
         search_entry.pack(fill='x', expand=True, ipady=4)
         
+        # Los productos se dibujan como rectángulos y textos de un solo Canvas, sólo los de las filas visibles
         canvas_prod = tk.Canvas(self.frame_productos, bg=Theme.COLOR_FONDO_SECUNDARIO, highlightthickness=0)
         canvas_prod.pack(side="left", fill="both", expand=True, padx=10, pady=(0,10))
+        self.canvas_prod = canvas_prod
         
         scrollbar_prod = ttk.Scrollbar(self.frame_productos, orient="vertical", command=canvas_prod.yview)
         scrollbar_prod.pack(side="right", fill="y", pady=(0,10), padx=(0,10))
         
-        self.grid_productos = tk.Frame(canvas_prod, bg=Theme.COLOR_FONDO_SECUNDARIO)
-        canvas_prod.create_window((0, 0), window=self.grid_productos, anchor="nw")
-        canvas_prod.configure(yscrollcommand=scrollbar_prod.set)
+        def al_desplazar(primero, ultimo):
+            scrollbar_prod.set(primero, ultimo)
+            self.dibujar_mosaicos_visibles()
+        canvas_prod.configure(yscrollcommand=al_desplazar)
         
         self.bind_all("<MouseWheel>", lambda e, c=canvas_cat, p=canvas_prod: self._on_mousewheel(e, c, p))
-        self.grid_productos.bind("<Configure>", lambda e: canvas_prod.configure(scrollregion=canvas_prod.bbox("all")))
+        canvas_prod.bind("<Button-1>", self.click_en_producto)
         self.ticket_tree.bind("<Double-1>", self.on_double_click_item)
         self.ticket_tree.bind("<plus>", self.aumentar_cantidad); self.ticket_tree.bind("<KP_Add>", self.aumentar_cantidad)
         self.ticket_tree.bind("<minus>", self.disminuir_cantidad); self.ticket_tree.bind("<KP_Subtract>", self.disminuir_cantidad)
-        self.frame_productos.bind("<Configure>", self.redraw_product_grid)
+        canvas_prod.bind("<Configure>", self.redraw_product_grid)
 
     def cerrar_mesa_vacia(self):
         orden = self.controller.ordenes_abiertas.get(self.controller.mesa_activa)
@@ -490,13 +613,13 @@ class VistaPedido(tk.Frame):
             ticket_item['nombre'] = new_value
         elif column_index == 2: # Precio Unitario
             try:
-                new_price = float(new_value)
+                new_price = Dinero.desde_pesos(new_value)
                 if new_price < 0: raise ValueError
                 ticket_item['precio'] = new_price
             except ValueError:
                 messagebox.showerror("Error", "Precio inválido. Debe ser un número positivo.")
                 return
-        self.actualizar_ticket_display()
+        self.actualizar_linea_ticket(item_id)
 
     def aumentar_cantidad(self, event):
         seleccion = self.ticket_tree.selection()
@@ -505,7 +628,7 @@ class VistaPedido(tk.Frame):
         orden = self.controller.ordenes_abiertas[self.controller.mesa_activa]
         if item_id in orden['ticket']:
             orden['ticket'][item_id]['cantidad'] += 1
-            self.actualizar_ticket_display()
+            self.actualizar_linea_ticket(item_id)
 
     def disminuir_cantidad(self, event):
         seleccion = self.ticket_tree.selection()
@@ -521,7 +644,7 @@ class VistaPedido(tk.Frame):
             
             if orden['ticket'][item_id]['cantidad'] <= 0:
                 del orden['ticket'][item_id]
-            self.actualizar_ticket_display()
+            self.actualizar_linea_ticket(item_id)
     
     def volver_a_mesas(self):
         self.controller.unbind("<space>")
@@ -566,42 +689,36 @@ class VistaPedido(tk.Frame):
             else:
                 self.label_titulo_ticket.config(text=f"Ticket Mesa {texto_mesa}")
         
-        self.cargar_categorias()
+        catalogo_cambio = self.cargar_categorias()
         self.actualizar_ticket_display()
-        self.search_var.set("")
-        self.id_categoria_actual = None
-        self.filtrar_productos()
+        # La cuadrícula sólo se vuelve a filtrar si quedó una búsqueda o categoría o si cambió el catálogo
+        if catalogo_cambio or self.search_var.get() or self.id_categoria_actual is not None:
+            self.id_categoria_actual = None
+            if self.search_var.get():
+                self.search_var.set("")  # dispara filtrar_productos
+            else:
+                self.filtrar_productos()
 
     def cargar_categorias(self):
+        """ Reconstruye los botones de categorías sólo si cambió el catálogo. Devuelve True si los reconstruyó. """
+        version = (cache_catalogo, cache_catalogo.version_actual())
+        if version == self.version_categorias:
+            return False
+        self.version_categorias = version
         for widget in self.frame_interior_categorias.winfo_children():
             widget.destroy()
         
         tk.Button(self.frame_interior_categorias, text="Todos", font=Theme.FONT_NORMAL, wraplength=160, justify="center", command=lambda: self.cargar_productos(None), relief="flat", bg="#D5DBDB", fg=Theme.COLOR_TEXTO_PRINCIPAL).pack(pady=3, padx=10, fill="x", ipady=8)
 
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, nombre FROM Categorias ORDER BY nombre")
-        for id_cat, nombre in cursor.fetchall():
+        for id_cat, nombre in cache_catalogo.lista_categorias():
             tk.Button(self.frame_interior_categorias, text=nombre, font=Theme.FONT_NORMAL, wraplength=160, justify="center", command=partial(self.cargar_productos, id_cat), relief="flat", bg="#ECF0F1", fg=Theme.COLOR_TEXTO_PRINCIPAL).pack(pady=3, padx=10, fill="x", ipady=8)
-        conn.close()
+        return True
 
     def filtrar_productos(self, *args):
-        termino_busqueda = self.search_var.get().lower()
         id_categoria_actual = getattr(self, 'id_categoria_actual', None)
-
-        conn = conectar_db()
-        cursor = conn.cursor()
-        
-        if id_categoria_actual:
-            query = "SELECT id, nombre, precio, precio_variable FROM Productos WHERE id_categoria = ? AND lower(nombre) LIKE ? ORDER BY nombre"
-            params = (id_categoria_actual, f'%{termino_busqueda}%')
-        else:
-            query = "SELECT id, nombre, precio, precio_variable FROM Productos WHERE lower(nombre) LIKE ? ORDER BY nombre"
-            params = (f'%{termino_busqueda}%',)
-        
-        cursor.execute(query, params)
-        self.current_products = cursor.fetchall()
-        conn.close()
+        self.current_products = cache_catalogo.filtrar(self.search_var.get(), id_categoria_actual)
+        self.liberar_mosaicos()
+        self.canvas_prod.yview_moveto(0)
         self.redraw_product_grid()
 
     def cargar_productos(self, id_categoria):
@@ -609,25 +726,72 @@ class VistaPedido(tk.Frame):
         self.filtrar_productos()
 
     def redraw_product_grid(self, event=None):
-        for widget in self.grid_productos.winfo_children():
-            widget.destroy()
-        
-        container_width = self.frame_productos.winfo_width()
-        button_width = 200
-        num_cols = max(1, container_width // button_width)
-        
-        for i, (id_prod, nombre, precio, es_variable) in enumerate(self.current_products):
-            info = {'id': id_prod, 'nombre': nombre, 'precio': precio, 'es_variable': es_variable}
-            texto_boton = f"{nombre}\n${precio:.2f}"
-            if es_variable:
-                texto_boton = f"{nombre}\n(Precio Variable)"
-            
-            btn = tk.Button(self.grid_productos, text=texto_boton, font=Theme.FONT_NORMAL, 
-                            width=20, height=5, wraplength=150, 
-                            command=partial(self.agregar_a_ticket, info),
-                            bg=Theme.COLOR_FONDO_SECUNDARIO, fg=Theme.COLOR_TEXTO_PRINCIPAL,
-                            relief="solid", bd=1)
-            btn.grid(row=i // num_cols, column=i % num_cols, padx=5, pady=5)
+        """ Ajusta columnas y alto desplazable al tamaño del Canvas; sólo se dibujan las filas visibles. """
+        num_cols = max(1, self.canvas_prod.winfo_width() // self.ANCHO_MOSAICO)
+        if num_cols != self.num_cols:
+            self.num_cols = num_cols
+            self.liberar_mosaicos()
+        filas = -(-len(self.current_products) // self.num_cols)
+        self.canvas_prod.configure(scrollregion=(0, 0, self.num_cols * self.ANCHO_MOSAICO, filas * self.ALTO_MOSAICO))
+        self.dibujar_mosaicos_visibles()
+
+    def liberar_mosaicos(self):
+        # Se ocultan y quedan disponibles para otros productos, sin borrarlos del Canvas
+        for rect, texto in self.mosaicos.values():
+            self.canvas_prod.itemconfigure(rect, state="hidden")
+            self.canvas_prod.itemconfigure(texto, state="hidden")
+            self.mosaicos_libres.append((rect, texto))
+        self.mosaicos.clear()
+
+    def dibujar_mosaicos_visibles(self):
+        canvas = self.canvas_prod
+        arriba = canvas.canvasy(0)
+        primera_fila = max(0, int(arriba // self.ALTO_MOSAICO))
+        ultima_fila = int((arriba + canvas.winfo_height()) // self.ALTO_MOSAICO)
+        visibles = range(primera_fila * self.num_cols, min(len(self.current_products), (ultima_fila + 1) * self.num_cols))
+
+        # Los mosaicos que salieron de la vista se reciclan para los que entran; los que siguen visibles no se tocan
+        for indice in [i for i in self.mosaicos if i not in visibles]:
+            rect, texto = self.mosaicos.pop(indice)
+            canvas.itemconfigure(rect, state="hidden")
+            canvas.itemconfigure(texto, state="hidden")
+            self.mosaicos_libres.append((rect, texto))
+        ancho = self.ANCHO_MOSAICO - 2 * self.MARGEN_MOSAICO
+        alto = self.ALTO_MOSAICO - 2 * self.MARGEN_MOSAICO
+        for indice in visibles:
+            if indice in self.mosaicos:
+                continue
+            if self.mosaicos_libres:
+                rect, texto = self.mosaicos_libres.pop()
+            else:
+                rect = canvas.create_rectangle(0, 0, 0, 0, fill=Theme.COLOR_FONDO_SECUNDARIO, outline=Theme.COLOR_TEXTO_PRINCIPAL)
+                texto = canvas.create_text(0, 0, font=Theme.FONT_NORMAL, width=150, justify="center", fill=Theme.COLOR_TEXTO_PRINCIPAL)
+            prod = self.current_products[indice]
+            x = (indice % self.num_cols) * self.ANCHO_MOSAICO + self.MARGEN_MOSAICO
+            y = (indice // self.num_cols) * self.ALTO_MOSAICO + self.MARGEN_MOSAICO
+            canvas.coords(rect, x, y, x + ancho, y + alto)
+            canvas.coords(texto, x + ancho / 2, y + alto / 2)
+            canvas.itemconfigure(rect, state="normal", fill=Theme.COLOR_FONDO_SECUNDARIO)
+            canvas.itemconfigure(texto, state="normal",
+                                 text=f"{prod.nombre}\n(Precio Variable)" if prod.precio_variable else f"{prod.nombre}\n${prod.precio:.2f}")
+            self.mosaicos[indice] = (rect, texto)
+
+    def click_en_producto(self, event):
+        # La posición del click indica directamente la fila y columna del producto
+        x, y = self.canvas_prod.canvasx(event.x), self.canvas_prod.canvasy(event.y)
+        columna, fila = int(x // self.ANCHO_MOSAICO), int(y // self.ALTO_MOSAICO)
+        dentro_x = self.MARGEN_MOSAICO <= x % self.ANCHO_MOSAICO <= self.ANCHO_MOSAICO - self.MARGEN_MOSAICO
+        dentro_y = self.MARGEN_MOSAICO <= y % self.ALTO_MOSAICO <= self.ALTO_MOSAICO - self.MARGEN_MOSAICO
+        indice = fila * self.num_cols + columna
+        if not (dentro_x and dentro_y and columna < self.num_cols and 0 <= indice < len(self.current_products)):
+            return
+        if indice in self.mosaicos:
+            # Un destello breve en lugar del relieve del botón
+            rect = self.mosaicos[indice][0]
+            self.canvas_prod.itemconfigure(rect, fill="#D6EAF8")
+            self.after(120, lambda: self.canvas_prod.itemconfigure(rect, fill=Theme.COLOR_FONDO_SECUNDARIO))
+        prod = self.current_products[indice]
+        self.agregar_a_ticket({'id': prod.id, 'nombre': prod.nombre, 'precio': prod.precio, 'es_variable': prod.precio_variable})
 
     def agregar_a_ticket(self, prod):
         ticket = self.controller.ordenes_abiertas[self.controller.mesa_activa]['ticket']
@@ -637,37 +801,68 @@ class VistaPedido(tk.Frame):
         if prod['es_variable']:
             dialog = simpledialog.askfloat("Precio Variable", f"Introduzca el precio para:\n{prod['nombre']}", parent=self)
             if dialog is None or dialog < 0: return
-            p_final = dialog
+            p_final = Dinero.desde_pesos(dialog)
             prod_id = f"var_{prod['id']}_{datetime.datetime.now().timestamp()}"
         
         if prod_id in ticket:
             ticket[prod_id]['cantidad'] += 1
         else:
             ticket[prod_id] = {'nombre': prod['nombre'], 'precio': p_final, 'cantidad': 1}
-        self.actualizar_ticket_display()
+        self.actualizar_linea_ticket(prod_id)
+
+    @staticmethod
+    def _valores_fila(item):
+        return (item['cantidad'], item['nombre'], f"{item['precio']:.2f}", f"{item['cantidad']*item['precio']:.2f}")
 
     def actualizar_ticket_display(self):
+        """ Vuelve a llenar el ticket completo; sólo al mostrar la mesa. Cada cambio posterior pasa por actualizar_linea_ticket. """
         last_selection = self.ticket_tree.selection()
         
         for i in self.ticket_tree.get_children():
             self.ticket_tree.delete(i)
+        # Importe de cada línea mostrada, para ajustar el total sin volver a sumar todo el ticket
+        self.importes_ticket = {}
         
         if not self.controller.mesa_activa: return
         orden = self.controller.ordenes_abiertas[self.controller.mesa_activa]
         ticket = orden['ticket']
         
-        total = sum(item['cantidad'] * item['precio'] for item in ticket.values())
-        orden['total'] = total
-        
         for i, (p_id, item) in enumerate(ticket.items()):
             tag = 'oddrow' if i % 2 == 0 else 'evenrow'
-            self.ticket_tree.insert("", "end", iid=p_id, values=(item['cantidad'], item['nombre'], f"{item['precio']:.2f}", f"{item['cantidad']*item['precio']:.2f}"), tags=(tag,))
+            self.ticket_tree.insert("", "end", iid=p_id, values=self._valores_fila(item), tags=(tag,))
+            self.importes_ticket[p_id] = item['cantidad'] * item['precio']
+        orden['total'] = sum(self.importes_ticket.values(), Dinero(0))
         
         if last_selection and self.ticket_tree.exists(last_selection[0]):
             self.ticket_tree.selection_set(last_selection[0])
             self.ticket_tree.focus(last_selection[0])
             
-        self.label_total.config(text=f"TOTAL: ${total:.2f}")
+        self.label_total.config(text=f"TOTAL: ${orden['total']:.2f}")
+
+    def actualizar_linea_ticket(self, item_id):
+        """ Refleja en ticket_tree el cambio de una línea de la orden (agregada, modificada o eliminada) y ajusta el total. """
+        orden = self.controller.ordenes_abiertas[self.controller.mesa_activa]
+        item = orden['ticket'].get(item_id)
+        importe_anterior = self.importes_ticket.pop(item_id, Dinero(0))
+        importe_nuevo = Dinero(0)
+        if item is None:
+            if self.ticket_tree.exists(item_id):
+                indice = self.ticket_tree.index(item_id)
+                self.ticket_tree.delete(item_id)
+                # Sólo las filas que siguen a la borrada cambian de color
+                for i, fila in enumerate(self.ticket_tree.get_children()[indice:], start=indice):
+                    self.ticket_tree.item(fila, tags=('oddrow' if i % 2 == 0 else 'evenrow',))
+        else:
+            importe_nuevo = item['cantidad'] * item['precio']
+            self.importes_ticket[item_id] = importe_nuevo
+            if self.ticket_tree.exists(item_id):
+                self.ticket_tree.item(item_id, values=self._valores_fila(item))
+            else:
+                # Las líneas nuevas van al final, como en la orden
+                tag = 'oddrow' if (len(self.importes_ticket) - 1) % 2 == 0 else 'evenrow'
+                self.ticket_tree.insert("", "end", iid=item_id, values=self._valores_fila(item), tags=(tag,))
+        orden['total'] = orden['total'] - importe_anterior + importe_nuevo
+        self.label_total.config(text=f"TOTAL: ${orden['total']:.2f}")
 
 class VistaPago(tk.Frame):
     def __init__(self, parent, controller):
@@ -732,7 +927,7 @@ class VistaPago(tk.Frame):
         self.controller.bind("<Return>", lambda e: self.finalizar_venta())
         self.orden_original = self.controller.ordenes_abiertas.get(self.controller.mesa_activa)
         if not self.orden_original: return
-        total = self.orden_original.get('total', 0.0)
+        total = self.orden_original.get('total', Dinero(0))
         self.label_total_original.config(text=f"${total:.2f}")
         self.descuento_var.set("0")
         self.paga_con_var.set("")
@@ -748,9 +943,9 @@ class VistaPago(tk.Frame):
 
     def actualizar_calculos(self, *args):
         try:
-            total_original = self.orden_original.get('total', 0.0)
-            descuento = float(self.descuento_var.get() or 0)
-            paga_con = float(self.paga_con_var.get() or 0) if self.metodo_pago.get() == "Efectivo" else 0
+            total_original = self.orden_original.get('total', Dinero(0))
+            descuento = Dinero.desde_pesos(self.descuento_var.get())
+            paga_con = Dinero.desde_pesos(self.paga_con_var.get()) if self.metodo_pago.get() == "Efectivo" else Dinero(0)
         except (ValueError, TypeError):
             self.total_final_var.set("$----")
             self.cambio_var.set("$----")
@@ -760,7 +955,7 @@ class VistaPago(tk.Frame):
             descuento = total_original
 
         total_final = total_original - descuento
-        cambio = paga_con - total_final if self.metodo_pago.get() == "Efectivo" else 0.0
+        cambio = paga_con - total_final if self.metodo_pago.get() == "Efectivo" else Dinero(0)
         
         self.total_final_var.set(f"${total_final:.2f}")
         self.cambio_var.set(f"${cambio:.2f}" if cambio >= 0 else "-")
@@ -771,57 +966,64 @@ class VistaPago(tk.Frame):
 
     def finalizar_venta(self):
         try:
-            total_final = float(self.total_final_var.get().replace('$', ''))
+            total_final = Dinero.desde_pesos(self.total_final_var.get().replace('$', ''))
             paga_con_str = self.paga_con_var.get()
             
             if not paga_con_str.replace('.', '', 1).isdigit() and self.metodo_pago.get() == "Efectivo":
                 messagebox.showerror("Error", "El monto 'Paga con' no es válido.")
                 return
 
-            paga_con = float(paga_con_str or 0)
+            paga_con = Dinero.desde_pesos(paga_con_str)
 
             if self.metodo_pago.get() == "Efectivo" and paga_con < total_final:
                 messagebox.showerror("Error", "La cantidad pagada es menor al total.")
                 return
             
             valor_mesa = self.orden_original['mesa']
-            descuento_final = float(self.descuento_var.get() or 0)
-
-            conn = conectar_db()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO Ventas (id_mesa, total, metodo_pago, descuento, paga_con, fecha_hora) VALUES (?, ?, ?, ?, ?, ?)",
-                (valor_mesa, total_final, self.metodo_pago.get(), descuento_final, paga_con, datetime.datetime.now())
-            )
-            id_venta = cursor.lastrowid
-            
+            descuento_final = min(Dinero.desde_pesos(self.descuento_var.get()), self.orden_original['total'])
+
+            lineas = []
             for prod_id, item in self.orden_original['ticket'].items():
                 real_prod_id = -1
                 if 'var_' in str(prod_id):
                     real_prod_id = int(str(prod_id).split('_')[1])
                 else:
                     real_prod_id = int(prod_id)
-                
-                cursor.execute(
-                    "INSERT INTO Detalle_Venta (id_venta, id_producto, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
-                    (id_venta, real_prod_id, item['cantidad'], item['precio'])
-                )
-            conn.commit()
-            conn.close()
-
-            
+                prod = cache_catalogo.producto(real_prod_id)
+                categoria = cache_catalogo.nombre_categoria(prod.id_categoria) if prod else None
+                lineas.append((real_prod_id, item['nombre'], categoria, item['cantidad'], item['precio']))
+
+            venta = {'id_mesa': valor_mesa, 'total': total_final, 'metodo_pago': self.metodo_pago.get(),
+                     'descuento': descuento_final, 'paga_con': paga_con, 'lineas': lineas,
+                     'momento': datetime.datetime.now()}
+            # La venta se guarda en segundo plano; el recibo se imprime cuando ya tiene su número.
+            # La mesa se libera ya, pero si la venta no se guarda su orden se le devuelve.
+            self.controller.escritor_ventas.encolar(venta, self.imprimir_recibo,
+                                                    partial(self.avisar_venta_no_guardada, venta,
+                                                            self.controller.mesa_activa, self.orden_original))
             
             cambio = paga_con - total_final
             if self.metodo_pago.get() == "Efectivo" and cambio > 0:
                 VentanaCambio(self.controller, cambio)
             
-            contenido_ticket = formatear_recibo_final(id_venta)
-            imprimir_ticket_fisico(contenido_ticket, con_logo=True)
-            
         except Exception as e:
             messagebox.showerror("Error Inesperado", f"Ocurrió un error al finalizar la venta: {e}")
         finally:
             self.controller.finalizar_y_liberar_mesa()
+
+    def imprimir_recibo(self, id_venta):
+        contenido_ticket = formatear_recibo_final(id_venta)
+        imprimir_ticket_fisico(contenido_ticket, con_logo=True)
+
+    def avisar_venta_no_guardada(self, venta, numero_mesa, orden, error):
+        mesa = self.controller.restaurar_orden(numero_mesa, orden)
+        if mesa is not None:
+            indicacion = f"La orden se devolvió a la mesa {mesa}: vuelva a cobrarla."
+        else:
+            indicacion = "No hay mesas libres para devolver la orden: vuelva a registrarla."
+        messagebox.showerror("Venta No Guardada",
+                             f"No se pudo guardar la venta de '{venta['id_mesa']}' por ${venta['total']:.2f} ({venta['metodo_pago']}).\n\n"
+                             f"{indicacion}\n\nError: {error}")
             
 
 class VistaGestion(tk.Frame):
@@ -909,6 +1111,12 @@ class VistaGestion(tk.Frame):
         frame_eliminar.pack(side="left", padx=(20, 0))
         tk.Button(frame_eliminar, text="Eliminar\nSeleccionado", command=self.eliminar_producto, font=Theme.FONT_BOTON, bg=Theme.COLOR_MESA_OCUPADA, fg="white", width=15, height=3).pack()
 
+        # --- Importar / exportar el menú completo (CSV o JSON) ---
+        frame_menu = tk.Frame(frame_controles)
+        frame_menu.pack(side="left", padx=(20, 0))
+        tk.Button(frame_menu, text="Importar Menú...", command=self.importar_menu, font=Theme.FONT_BOTON, bg=Theme.COLOR_ACCENT_PRIMARY, fg="white", width=15).pack(pady=(0, 5), ipady=5)
+        tk.Button(frame_menu, text="Exportar Menú...", command=self.exportar_menu, font=Theme.FONT_BOTON, width=15).pack(ipady=5)
+
         # --- Frame inferior para la lista con scroll ---
         frame_lista = tk.Frame(tab)
         frame_lista.pack(pady=10, padx=20, fill="both", expand=True)
@@ -928,31 +1136,20 @@ class VistaGestion(tk.Frame):
     def cargar_categorias(self):
         self.lista_categorias.delete(0, tk.END)
         self.lista_productos_cat.delete(0, tk.END)
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT nombre FROM Categorias ORDER BY nombre")
-        for row in cursor.fetchall():
-            self.lista_categorias.insert(tk.END, row[0])
-        conn.close()
+        for _, nombre in cache_catalogo.lista_categorias():
+            self.lista_categorias.insert(tk.END, nombre)
 
     def cargar_productos(self):
         for i in self.tree_productos.get_children():
             self.tree_productos.delete(i)
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT p.id, p.nombre, p.precio, c.nombre, p.precio_variable FROM Productos p JOIN Categorias c ON p.id_categoria = c.id ORDER BY p.id")
-        for row in cursor.fetchall():
-            id_prod, nombre, precio, cat, es_var = row
-            variable_texto = "Sí" if es_var else "No"
-            self.tree_productos.insert("", "end", values=(id_prod, nombre, f"${precio:.2f}", cat, variable_texto))
-        conn.close()
+        for prod in sorted(cache_catalogo.lista_productos(), key=lambda p: p.id):
+            cat = cache_catalogo.nombre_categoria(prod.id_categoria)
+            if cat is None: continue
+            variable_texto = "Sí" if prod.precio_variable else "No"
+            self.tree_productos.insert("", "end", values=(prod.id, prod.nombre, f"${prod.precio:.2f}", cat, variable_texto))
 
     def cargar_categorias_en_combobox(self):
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT nombre FROM Categorias ORDER BY nombre")
-        self.combo_prod_categoria['values'] = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        self.combo_prod_categoria['values'] = [nombre for _, nombre in cache_catalogo.lista_categorias()]
 
     def anadir_producto(self):
         nombre = self.entry_prod_nombre.get().strip()
@@ -963,30 +1160,37 @@ class VistaGestion(tk.Frame):
             messagebox.showwarning("Campos incompletos", "Todos los campos (Nombre, Precio, Categoría) son obligatorios.")
             return
         try:
-            precio = float(precio_str)
+            precio = Dinero.desde_pesos(precio_str)
         except ValueError:
             messagebox.showerror("Error de formato", "El precio debe ser un número.")
             return
+        id_categoria = next((id_cat for id_cat, nombre in cache_catalogo.lista_categorias() if nombre == categoria), None)
+        if id_categoria is None:
+            messagebox.showerror("Error", "La categoría seleccionada no es válida.")
+            return
         try:
-            conn = conectar_db()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM Categorias WHERE nombre = ?", (categoria,))
-            id_categoria_result = cursor.fetchone()
-            if not id_categoria_result:
-                messagebox.showerror("Error", "La categoría seleccionada no es válida.")
-                return
-            id_categoria = id_categoria_result[0]
-            cursor.execute("INSERT INTO Productos (nombre, precio, id_categoria, precio_variable) VALUES (?, ?, ?, ?)", (nombre, precio, id_categoria, es_variable))
-            conn.commit()
+            with gestor_db.transaccion() as cursor:
+                cursor.execute("INSERT INTO Productos (nombre, precio, id_categoria, precio_variable) VALUES (?, ?, ?, ?)", (nombre, precio, id_categoria, es_variable))
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", f"El producto '{nombre}' ya existe.")
-        finally:
-            conn.close()
-            self.entry_prod_nombre.delete(0, tk.END)
-            self.entry_prod_precio.delete(0, tk.END)
-            self.precio_variable_var.set(False)
-            self.cargar_productos()
-            messagebox.showinfo("Éxito", f"Producto '{nombre}' añadido.")
+            return
+        except sqlite3.OperationalError as e:
+            self.avisar_error_bd(e)
+            return
+        cache_catalogo.invalidar()
+        self.entry_prod_nombre.delete(0, tk.END)
+        self.entry_prod_precio.delete(0, tk.END)
+        self.precio_variable_var.set(False)
+        self.cargar_productos()
+        messagebox.showinfo("Éxito", f"Producto '{nombre}' añadido.")
+
+    def avisar_error_bd(self, error):
+        """ Avisa de un cambio del menú que no se guardó; si otra terminal tenía la base ocupada, basta reintentar. """
+        if es_bloqueo(error):
+            messagebox.showerror("Base Ocupada", "Otra terminal está usando la base de datos y el cambio no se guardó.\n\n"
+                                                 "Intente de nuevo en unos segundos.")
+        else:
+            messagebox.showerror("Error", f"No se pudo guardar el cambio.\n\nError: {error}")
 
     def eliminar_producto(self):
         if not self.tree_productos.selection():
@@ -995,40 +1199,62 @@ class VistaGestion(tk.Frame):
         item_seleccionado = self.tree_productos.item(self.tree_productos.selection()[0])
         prod_id, prod_nombre = item_seleccionado['values'][0], item_seleccionado['values'][1]
         if messagebox.askyesno("Confirmar", f"¿Seguro que quieres eliminar el producto '{prod_nombre}'?"):
-            conn = conectar_db()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Productos WHERE id = ?", (prod_id,))
-            conn.commit()
-            conn.close()
+            try:
+                with gestor_db.transaccion() as cursor:
+                    cursor.execute("DELETE FROM Productos WHERE id = ?", (prod_id,))
+            except sqlite3.OperationalError as e:
+                self.avisar_error_bd(e)
+                return
+            cache_catalogo.invalidar()
             self.cargar_productos()
             messagebox.showinfo("Éxito", "Producto eliminado.")
 
+    def importar_menu(self):
+        ruta = filedialog.askopenfilename(parent=self, title="Importar Menú", filetypes=[("Menú", "*.csv *.json"), ("CSV", "*.csv"), ("JSON", "*.json")])
+        if not ruta: return
+        try:
+            resultado = importar_archivo(gestor_db, ruta)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            messagebox.showerror("Error al Importar", f"No se pudo importar el menú.\n\nError: {e}")
+            return
+        cache_catalogo.invalidar()
+        self.cargar_datos()
+        messagebox.showinfo("Menú Importado", describir_resultado(resultado))
+
+    def exportar_menu(self):
+        ruta = filedialog.asksaveasfilename(parent=self, title="Exportar Menú", defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("JSON", "*.json")])
+        if not ruta: return
+        try:
+            total = exportar_menu(gestor_db, ruta)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Error al Exportar", f"No se pudo exportar el menú.\n\nError: {e}")
+            return
+        messagebox.showinfo("Menú Exportado", f"Se exportaron {total} productos a:\n{ruta}")
+
     def mostrar_productos_de_categoria(self, event=None):
         if not self.lista_categorias.curselection():
             self.lista_productos_cat.delete(0, tk.END)
             return
         nombre_cat = self.lista_categorias.get(self.lista_categorias.curselection())
         self.lista_productos_cat.delete(0, tk.END)
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT p.nombre, p.precio FROM Productos p JOIN Categorias c ON p.id_categoria = c.id WHERE c.nombre = ? ORDER BY p.nombre", (nombre_cat,))
-        for n, p in cursor.fetchall():
-            self.lista_productos_cat.insert(tk.END, f"{n} - ${p:.2f}")
-        conn.close()
+        for id_cat, nombre in cache_catalogo.lista_categorias():
+            if nombre == nombre_cat:
+                for prod in cache_catalogo.lista_productos(id_cat):
+                    self.lista_productos_cat.insert(tk.END, f"{prod.nombre} - ${prod.precio:.2f}")
 
     def anadir_categoria(self):
         nombre = self.entry_categoria.get().strip()
         if nombre:
             try:
-                conn = conectar_db()
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO Categorias (nombre) VALUES (?)", (nombre,))
-                conn.commit()
-                conn.close()
+                with gestor_db.transaccion() as cursor:
+                    cursor.execute("INSERT INTO Categorias (nombre) VALUES (?)", (nombre,))
+                cache_catalogo.invalidar()
                 self.entry_categoria.delete(0, tk.END)
                 self.cargar_datos()
             except sqlite3.IntegrityError:
                 messagebox.showerror("Error", "Esa categoría ya existe.")
+            except sqlite3.OperationalError as e:
+                self.avisar_error_bd(e)
         else:
             messagebox.showwarning("Inválido", "El nombre no puede estar vacío.")
 
@@ -1038,12 +1264,14 @@ class VistaGestion(tk.Frame):
             return
         nombre_cat = self.lista_categorias.get(self.lista_categorias.curselection())
         if messagebox.askyesno("Confirmar", f"¿Eliminar '{nombre_cat}'? Se eliminarán TODOS los productos de esta categoría."):
-            conn = conectar_db()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM Productos WHERE id_categoria = (SELECT id FROM Categorias WHERE nombre = ?)", (nombre_cat,))
-            cursor.execute("DELETE FROM Categorias WHERE nombre = ?", (nombre_cat,))
-            conn.commit()
-            conn.close()
+            try:
+                with gestor_db.transaccion() as cursor:
+                    cursor.execute("DELETE FROM Productos WHERE id_categoria = (SELECT id FROM Categorias WHERE nombre = ?)", (nombre_cat,))
+                    cursor.execute("DELETE FROM Categorias WHERE nombre = ?", (nombre_cat,))
+            except sqlite3.OperationalError as e:
+                self.avisar_error_bd(e)
+                return
+            cache_catalogo.invalidar()
             self.cargar_datos()
 
 # ===================================================================
@@ -1071,6 +1299,15 @@ class VistaReporte(tk.Frame):
         paned_window.paneconfigure(frame_historial, minsize=280)
         tk.Label(frame_historial, text="Historial de Cortes", font=Theme.FONT_SUBTITULO, bg=Theme.COLOR_FONDO_SECUNDARIO, fg=Theme.COLOR_TEXTO_PRINCIPAL).pack(pady=(0, 10), anchor="w")
 
+        # Sólo en la base consolidada (con sucursales) se muestra el filtro por sucursal
+        self.sucursales = lista_sucursales(gestor_reportes)
+        self.sucursal_var = tk.StringVar(value="Todas")
+        if self.sucursales:
+            combo_sucursal = ttk.Combobox(frame_historial, textvariable=self.sucursal_var, state="readonly", font=Theme.FONT_NORMAL,
+                                          values=["Todas"] + self.sucursales)
+            combo_sucursal.pack(fill='x', pady=(0, 10))
+            combo_sucursal.bind("<<ComboboxSelected>>", lambda e: self.cargar_datos())
+
         style = ttk.Style()
         style.configure("Historial.Treeview", rowheight=30, font=Theme.FONT_NORMAL, background=Theme.COLOR_FONDO_SECUNDARIO)
         style.configure("Historial.Treeview.Heading", font=Theme.FONT_BOTON)
@@ -1107,42 +1344,28 @@ class VistaReporte(tk.Frame):
         self.cargar_historial_cortes()
         self.mostrar_reporte_actual()
 
+    def sucursal_seleccionada(self):
+        sucursal = self.sucursal_var.get()
+        return None if sucursal == "Todas" else sucursal
+
     def cargar_historial_cortes(self):
         for item in self.tree_historial.get_children():
             self.tree_historial.delete(item)
-        conn = conectar_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT corte_id FROM Ventas WHERE corte_id IS NOT NULL ORDER BY corte_id DESC")
-        for row in cursor.fetchall():
-            self.tree_historial.insert("", "end", values=(row[0],))
-        conn.close()
+        for corte_id in lista_cortes(gestor_reportes, self.sucursal_seleccionada()):
+            self.tree_historial.insert("", "end", values=(corte_id,))
 
     def generar_reporte_texto(self, fecha_str=None, es_historico=False):
-        conn = conectar_db()
-        cursor = conn.cursor()
-        
+        # Los totales salen de Resumen_Diario, que se actualiza con cada venta
+        sucursal = self.sucursal_seleccionada()
         if es_historico:
-            query = """
-                SELECT COUNT(*), SUM(total), SUM(descuento),
-                       SUM(CASE WHEN metodo_pago = 'Efectivo' THEN total ELSE 0 END),
-                       SUM(CASE WHEN metodo_pago = 'Tarjeta' THEN total ELSE 0 END)
-                FROM Ventas WHERE corte_id = ?
-            """
-            params = (fecha_str,)
+            resultado = resumen_de_corte(gestor_reportes, fecha_str, sucursal)
             titulo = f"REPORTE HISTÓRICO - {datetime.datetime.strptime(fecha_str, '%Y-%m-%d').strftime('%d/%m/%Y')}"
         else:
-            query = """
-                SELECT COUNT(*), SUM(total), SUM(descuento),
-                       SUM(CASE WHEN metodo_pago = 'Efectivo' THEN total ELSE 0 END),
-                       SUM(CASE WHEN metodo_pago = 'Tarjeta' THEN total ELSE 0 END)
-                FROM Ventas WHERE DATE(fecha_hora) = DATE('now', 'localtime') AND corte_id IS NULL
-            """
-            params = ()
-            titulo = f"REPORTE DEL DIA - {datetime.datetime.now().strftime('%d/%m/%Y')} (ACTUAL)"
-        
-        cursor.execute(query, params)
-        resultado = cursor.fetchone()
-        conn.close()
+            hoy = fecha_negocio(datetime.datetime.now(), HORA_CORTE_DIA)
+            resultado = resumen_del_dia(gestor_reportes, hoy, sucursal)
+            titulo = f"REPORTE DEL DIA - {datetime.datetime.strptime(hoy, '%Y-%m-%d').strftime('%d/%m/%Y')} (ACTUAL)"
+        if sucursal:
+            titulo += f"\nSUCURSAL: {sucursal}"
 
         num_ventas, total_dia, total_descuento, total_efectivo, total_tarjeta = (resultado or (0, 0, 0, 0, 0))
         num_ventas = num_ventas or 0
@@ -1170,37 +1393,17 @@ class VistaReporte(tk.Frame):
             fecha_seleccionada = self.tree_historial.item(selection[0], "values")[0]
             es_historico = True
 
-        conn = conectar_db()
-        cursor = conn.cursor()
-
+        # Se lee el resumen por producto ya sumado, no Detalle_Venta
+        sucursal = self.sucursal_seleccionada()
         if es_historico:
-            query = """
-                SELECT p.nombre, SUM(dv.cantidad), SUM(dv.cantidad * dv.precio_unitario)
-                FROM Detalle_Venta dv
-                JOIN Productos p ON dv.id_producto = p.id
-                JOIN Ventas v ON dv.id_venta = v.id
-                WHERE v.corte_id = ?
-                GROUP BY p.nombre
-                ORDER BY SUM(dv.cantidad) DESC
-            """
-            params = (fecha_seleccionada,)
+            productos = productos_de_corte(gestor_reportes, fecha_seleccionada, CARPETA_ARCHIVO, sucursal)
             titulo = f"VENTAS POR PRODUCTO - {datetime.datetime.strptime(fecha_seleccionada, '%Y-%m-%d').strftime('%d/%m/%Y')}"
         else:
-            query = """
-                SELECT p.nombre, SUM(dv.cantidad), SUM(dv.cantidad * dv.precio_unitario)
-                FROM Detalle_Venta dv
-                JOIN Productos p ON dv.id_producto = p.id
-                JOIN Ventas v ON dv.id_venta = v.id
-                WHERE DATE(v.fecha_hora) = DATE('now', 'localtime') AND v.corte_id IS NULL
-                GROUP BY p.nombre
-                ORDER BY SUM(dv.cantidad) DESC
-            """
-            params = ()
-            titulo = f"VENTAS POR PRODUCTO - {datetime.datetime.now().strftime('%d/%m/%Y')} (ACTUAL)"
-
-        cursor.execute(query, params)
-        productos = cursor.fetchall()
-        conn.close()
+            hoy = fecha_negocio(datetime.datetime.now(), HORA_CORTE_DIA)
+            productos = productos_del_dia(gestor_reportes, hoy, sucursal)
+            titulo = f"VENTAS POR PRODUCTO - {datetime.datetime.strptime(hoy, '%Y-%m-%d').strftime('%d/%m/%Y')} (ACTUAL)"
+        if sucursal:
+            titulo += f" - {sucursal}"
 
         texto = f"{titulo}\n{'='*45}\n"
         texto += "Cant  Producto             Total\n"
@@ -1224,7 +1427,8 @@ class VistaReporte(tk.Frame):
         self.btn_cerrar_caja.pack(side='left', expand=True, fill='x', padx=(5,0))
         self.btn_reporte_productos.pack(side="left", expand=True, fill='x', padx=(0,5))
         
-        self.btn_cerrar_caja.config(state="normal")
+        # La base consolidada sólo recibe los cortes que hace cada sucursal
+        self.btn_cerrar_caja.config(state="disabled" if self.sucursales else "normal")
         self.btn_reporte_productos.config(state="normal")
 
     def mostrar_reporte_historico(self, event=None):
@@ -1249,6 +1453,8 @@ class VistaReporte(tk.Frame):
         self.reporte_widget.config(state="disabled")
 
     def cerrar_caja_hoy(self):
+        # Las ventas que aún se están guardando deben entrar en este corte
+        self.controller.escritor_ventas.vaciar()
         reporte_a_cerrar = self.generar_reporte_texto(es_historico=False)
         if "Total de Ventas (Tickets): 0" in reporte_a_cerrar:
             messagebox.showinfo("Caja Vacía", "No hay ventas para cerrar el dia de hoy.")
@@ -1262,13 +1468,25 @@ class VistaReporte(tk.Frame):
             try:
                 imprimir_ticket_fisico(reporte_a_cerrar, con_logo=True)
             finally:
-                fecha_hoy_str = datetime.date.today().strftime('%Y-%m-%d')
-                conn = conectar_db()
-                cursor = conn.cursor()
-                cursor.execute("UPDATE Ventas SET corte_id = ? WHERE DATE(fecha_hora) = DATE('now', 'localtime') AND corte_id IS NULL",
-                               (fecha_hoy_str,))
-                conn.commit()
-                conn.close()
+                fecha_hoy_str = fecha_negocio(datetime.datetime.now(), HORA_CORTE_DIA)
+                # Un solo registro en Cortes con el rango de ventas y los totales congelados
+                try:
+                    cerrar_corte(gestor_db, fecha_hoy_str, datetime.datetime.now())
+                except ValueError as e:
+                    messagebox.showerror("Error al Cerrar", f"No se pudo cerrar la caja.\n\nError: {e}")
+                    return
+                if modo_entrenamiento:
+                    # La copia en memoria no se archiva, ni se mantiene, ni se respalda
+                    messagebox.showinfo("Cierre de Práctica", f"Corte de práctica del dia {fecha_hoy_str} finalizado.")
+                    self.cargar_datos()
+                    return
+                if DIAS_ARCHIVO > 0:
+                    try:
+                        archivar_cortes_antiguos(gestor_db, CARPETA_ARCHIVO, DIAS_ARCHIVO)
+                    except Exception as e:
+                        print(f"ERROR: No se pudieron archivar los cortes antiguos: {e}")
+                # Mantenimiento completo y, al terminar, el respaldo del día
+                self.controller.servicio_mantenimiento.solicitar(vacuum_completo=True, despues=self.controller.servicio_respaldo.solicitar)
                 messagebox.showinfo("Cierre Exitoso", f"Corte del dia {fecha_hoy_str} finalizado.")
                 self.cargar_datos()
 
@@ -1288,31 +1506,139 @@ class App(tk.Tk):
 
         style = ttk.Style(self)
         style.theme_use('clam')
+        # Lo usan VistaPedido y VistaGestion, que pueden construirse en cualquier orden
+        style.configure("Custom.Treeview", rowheight=35, font=Theme.FONT_NORMAL, background=Theme.COLOR_FONDO_SECUNDARIO, foreground=Theme.COLOR_TEXTO_PRINCIPAL, fieldbackground=Theme.COLOR_FONDO_SECUNDARIO)
+        style.map("Custom.Treeview", background=[('selected', Theme.COLOR_ACCENT_PRIMARY)])
+        style.configure("Custom.Treeview.Heading", font=Theme.FONT_BOTON, background="#EAECEE", foreground=Theme.COLOR_TEXTO_PRINCIPAL)
 
         self.estado_mesas = {i: "libre" for i in range(1, 15)}
         self.ordenes_abiertas = {}
         self.mesa_activa = None
+        # revisar_inactividad() la consulta desde la primera llamada
+        self.vista_actual = None
         self.fullscreen_state = True
         self.bind("<F11>", self.toggle_fullscreen)
         self.bind("<Escape>", self.volver_a_mesas_global)
 
+        # Gestores de la base real mientras se practica sobre la copia en memoria
+        self.gestores_reales = None
+        self.aviso_entrenamiento = tk.Label(self, text="MODO ENTRENAMIENTO - Las ventas no se guardan ni se imprimen", font=Theme.FONT_BOTON,
+                                            bg=Theme.COLOR_ACCENT_WARNING, fg=Theme.COLOR_TEXTO_CABECERA, pady=6)
+
         container = tk.Frame(self, bg=Theme.COLOR_FONDO_PRINCIPAL)
         container.pack(side="top", fill="both", expand=True)
+        self.container = container
         container.grid_rowconfigure(0, weight=1)
         container.grid_columnconfigure(0, weight=1)
 
+        # Sólo se construye la vista de mesas; las demás al abrirse por primera vez (ver vista())
         self.vistas = {}
-        for F in (VistaMesas, VistaPedido, VistaPago, VistaGestion, VistaReporte):
-            frame = F(container, self)
-            self.vistas[F] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
+        self.vista(VistaMesas)
+
+        # Hilo que guarda las ventas sin congelar la pantalla del cajero
+        self.escritor_ventas = EscritorVentas(gestor_db, HORA_CORTE_DIA, terminal=TERMINAL)
+        self.escritor_ventas.start()
+        self.atender_escritor_ventas()
+
+        # Respaldos de la base en segundo plano, copiando unas cuantas páginas a la vez
+        self.servicio_respaldo = ServicioRespaldo(DB_FILE, CARPETA_RESPALDOS, PAGINAS_POR_PASO_RESPALDO,
+                                                  PAUSA_RESPALDO, RESPALDOS_A_CONSERVAR, INTERVALO_RESPALDO)
+        self.servicio_respaldo.start()
+
+        self.servicio_mantenimiento = ServicioMantenimiento(gestor_db, PRESUPUESTO_MANTENIMIENTO)
+        self.servicio_mantenimiento.start()
+
+        # Envío de la bitácora de cambios a la base en espera
+        self.servicio_replica = None
+        if RUTA_REPLICA:
+            self.servicio_replica = ServicioReplica(gestor_db, RUTA_REPLICA, INTERVALO_REPLICA)
+            self.servicio_replica.start()
+        self.ultima_actividad = time.monotonic()
+        self.mantenimiento_pendiente = True
+        self.bind_all("<Any-KeyPress>", self.registrar_actividad, add="+")
+        self.bind_all("<Any-ButtonPress>", self.registrar_actividad, add="+")
+        self.revisar_inactividad()
 
-        self.vista_actual = None
         self.mostrar_vista(VistaMesas)
+        # Las tareas "idle" se atienden en orden: ésta corre cuando la pantalla de mesas ya se dibujó
+        self.after_idle(self.primera_pantalla_lista)
+
+    def vista(self, clase_vista):
+        """ Devuelve la vista, construyéndola la primera vez que se necesita. """
+        frame = self.vistas.get(clase_vista)
+        if frame is None:
+            inicio = time.perf_counter()
+            frame = clase_vista(self.container, self)
+            frame.grid(row=0, column=0, sticky="nsew")
+            # Queda debajo de la vista actual hasta que se muestre con tkraise
+            frame.lower()
+            self.vistas[clase_vista] = frame
+            print(f"Vista {clase_vista.__name__} construida en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return frame
+
+    def primera_pantalla_lista(self):
+        print(f"Primera pantalla lista en {(time.perf_counter() - INICIO_ARRANQUE) * 1000:.0f} ms")
+        if PRECARGAR_VISTAS:
+            self.after(500, self.precargar_vistas, [VistaPedido, VistaPago, VistaReporte, VistaGestion])
+
+    def precargar_vistas(self, pendientes):
+        # Una vista por turno, para que la interfaz siga respondiendo entre una y otra
+        while pendientes and pendientes[0] in self.vistas:
+            pendientes.pop(0)
+        if pendientes:
+            self.vista(pendientes.pop(0))
+            self.after(200, self.precargar_vistas, pendientes)
+
+    def alternar_entrenamiento(self):
+        """ Entra o sale del modo entrenamiento: ventas, catálogo y reportes pasan a una copia en memoria de la base. """
+        global gestor_db, gestor_reportes, cache_catalogo, modo_entrenamiento
+        if self.ordenes_abiertas:
+            messagebox.showwarning("Mesas Abiertas", "Cobre o cierre las mesas abiertas antes de cambiar de modo.")
+            return
+        inicio = time.perf_counter()
+        # Las ventas pendientes se guardan (y sus tickets se imprimen) en la base en la que se hicieron
+        self.escritor_ventas.detener()
+        self.escritor_ventas.despachar_resultados()
+        if self.gestores_reales is None:
+            self.gestores_reales = (gestor_db, gestor_reportes, cache_catalogo)
+            gestor_db = gestor_reportes = gestor_db.clonar_en_memoria()
+            cache_catalogo = CacheCatalogo(gestor_db)
+            modo_entrenamiento = True
+            self.aviso_entrenamiento.pack(side="top", fill="x", before=self.container)
+            self.title("Punto de Venta - ENTRENAMIENTO")
+            self.vistas[VistaMesas].boton_entrenamiento.config(text="🎓 Salir de Entrenamiento")
+        else:
+            gestor_db.cerrar()
+            gestor_db, gestor_reportes, cache_catalogo = self.gestores_reales
+            self.gestores_reales = None
+            modo_entrenamiento = False
+            self.aviso_entrenamiento.pack_forget()
+            self.title("Punto de Venta")
+            self.vistas[VistaMesas].boton_entrenamiento.config(text="🎓 Modo Entrenamiento")
+        self.escritor_ventas = EscritorVentas(gestor_db, HORA_CORTE_DIA, terminal=TERMINAL)
+        self.escritor_ventas.start()
+        print(f"Modo entrenamiento {'activado' if modo_entrenamiento else 'desactivado'} en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        self.mostrar_vista(VistaMesas)
+
+    def atender_escritor_ventas(self):
+        self.escritor_ventas.despachar_resultados()
+        self.after(100, self.atender_escritor_ventas)
+
+    def registrar_actividad(self, event=None):
+        self.ultima_actividad = time.monotonic()
+        self.mantenimiento_pendiente = True
+
+    def revisar_inactividad(self):
+        # Una pasada de mantenimiento por cada periodo sin uso en la vista de mesas
+        inactiva = time.monotonic() - self.ultima_actividad >= MINUTOS_INACTIVIDAD * 60
+        if self.mantenimiento_pendiente and inactiva and self.vista_actual == VistaMesas:
+            self.mantenimiento_pendiente = False
+            self.servicio_mantenimiento.solicitar()
+        self.after(30000, self.revisar_inactividad)
 
     def mostrar_vista(self, clase_vista):
         self.vista_actual = clase_vista
-        frame = self.vistas[clase_vista]
+        frame = self.vista(clase_vista)
         if hasattr(frame, 'cargar_datos'):
             frame.cargar_datos()
         frame.tkraise()
@@ -1326,7 +1652,7 @@ class App(tk.Tk):
     def seleccionar_mesa(self, numero_boton, valor_orden):
         self.mesa_activa = numero_boton
         if numero_boton not in self.ordenes_abiertas:
-            self.ordenes_abiertas[numero_boton] = {'mesa': valor_orden, 'ticket': {}, 'total': 0.0}
+            self.ordenes_abiertas[numero_boton] = {'mesa': valor_orden, 'ticket': {}, 'total': Dinero(0)}
             self.estado_mesas[numero_boton] = "ocupada"
             self.vistas[VistaMesas].actualizar_colores()
         self.mostrar_vista(VistaPedido)
@@ -1358,6 +1684,22 @@ class App(tk.Tk):
         self.mesa_activa = None
         self.mostrar_vista(VistaMesas)
 
+    def restaurar_orden(self, numero_mesa, orden):
+        """ Vuelve a abrir la orden de una venta que no se pudo guardar; si su mesa ya se ocupó, usa otra libre.
+
+        Devuelve el número de mesa, o None si no queda ninguna libre.
+        """
+        if numero_mesa in self.ordenes_abiertas or numero_mesa not in self.estado_mesas:
+            libres = [m for m, estado in self.estado_mesas.items() if estado == "libre" and m not in self.ordenes_abiertas]
+            if not libres:
+                return None
+            numero_mesa = libres[0]
+            orden['mesa'] = str(numero_mesa)
+        self.ordenes_abiertas[numero_mesa] = orden
+        self.estado_mesas[numero_mesa] = "ocupada"
+        self.vistas[VistaMesas].actualizar_colores()
+        return numero_mesa
+
     def finalizar_y_liberar_mesa(self):
         self.unbind("<Return>")
         numero_mesa = self.mesa_activa
@@ -1382,6 +1724,28 @@ if __name__ == "__main__":
         if not os.path.exists(DB_FILE):
             error_msg += f"No se encontró el archivo de base de datos '{DB_FILE}'.\n"
         messagebox.showerror("Error de Archivos Críticos", error_msg)
+    elif es_replica(gestor_db):
+        messagebox.showerror("Base en Espera",
+                             f"'{DB_FILE}' es una base en espera y no se puede usar para vender.\n\n"
+                             f"Promuévala primero con:\npython replica.py promover \"{DB_FILE}\"")
+        gestor_db.cerrar()
     else:
+        # Pone al día el esquema (tablas, columnas e índices) sin tocar los datos existentes
+        aplicar_migraciones(gestor_db)
+        if os.path.isdir(CARPETA_ARCHIVO):
+            actualizar_archivos(gestor_db, CARPETA_ARCHIVO)
         app = App()
-        app.mainloop()
\ No newline at end of file
+        try:
+            app.mainloop()
+        finally:
+            app.escritor_ventas.detener()
+            if app.gestores_reales:
+                # Se salió en modo entrenamiento: la copia en memoria se descarta
+                gestor_db.cerrar()
+                gestor_db, gestor_reportes, cache_catalogo = app.gestores_reales
+            app.servicio_mantenimiento.detener()
+            if app.servicio_replica:
+                app.servicio_replica.detener()
+            app.servicio_respaldo.detener()
+            gestor_reportes.cerrar()
+            gestor_db.cerrar()
\ No newline at end of file
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Mantenimiento periódico de la base de datos.
+
+Se ejecuta en momentos de poco movimiento (después del cierre de caja o cuando la
+App lleva un rato sin uso en la vista de mesas) y en un hilo aparte. Cada paso se
+registra con su duración y trabaja por tandas mientras quede presupuesto de tiempo;
+lo que no alcanza se deja para la siguiente vez.
+
+El VACUUM completo que activa auto_vacuum incremental bloquea a las demás terminales
+mientras dura: tras el cierre sólo se hace si la base es lo bastante chica para el
+presupuesto, y si no, con las cajas cerradas:
+    python mantenimiento.py <ruta_db> vacuum
+"""
+import datetime
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+# Páginas libres que se devuelven al sistema en cada tanda de incremental_vacuum
+PAGINAS_VACUUM = 256
+# Días sin que ninguna terminal envíe la bitácora antes de apagarla (ver replica.py)
+DIAS_SIN_ENVIO = 3
+# Filas de Registro_Cambios que se borran en cada tanda
+FILAS_REGISTRO = 5000
+# Estimación conservadora de lo que VACUUM reescribe por segundo en el disco de una caja
+BYTES_POR_SEGUNDO_VACUUM = 20 * 1024 * 1024
+# Segundos que optimize, ANALYZE y el checkpoint esperan a otras conexiones antes de rendirse
+ESPERA_MANTENIMIENTO = 0.25
+
+
+def _podar_registro(gestor, limite, vacuum_completo):
+    fila = gestor.consultar_uno("SELECT activo, enviado_en FROM Estado_Registro WHERE id = 1")
+    if fila is None:
+        return None
+    activo, enviado_en = fila
+    hace_dias = datetime.datetime.now() - datetime.timedelta(days=DIAS_SIN_ENVIO)
+    if activo and enviado_en and datetime.datetime.fromisoformat(enviado_en) > hace_dias:
+        return None
+    if activo:
+        # Nadie la está enviando: se apaga y el próximo envío copiará la base completa
+        with gestor.transaccion() as cursor:
+            cursor.execute("UPDATE Estado_Registro SET activo = 0 WHERE id = 1")
+    borradas = 0
+    while time.monotonic() < limite:
+        # Una transacción por tanda, para que una venta no espere a que se borre todo
+        with gestor.transaccion() as cursor:
+            cursor.execute(
+                "DELETE FROM Registro_Cambios WHERE id IN (SELECT id FROM Registro_Cambios ORDER BY id LIMIT ?)",
+                (FILAS_REGISTRO,))
+            tanda = cursor.rowcount
+        borradas += tanda
+        if tanda < FILAS_REGISTRO:
+            break
+    if activo:
+        return f"bitácora apagada tras {DIAS_SIN_ENVIO} días sin enviarse, {borradas} cambios borrados"
+    return f"{borradas} cambios borrados" if borradas else None
+
+
+def _optimizar(conn, limite, vacuum_completo):
+    conn.execute("PRAGMA optimize")
+
+
+def _analizar(conn, limite, vacuum_completo):
+    # analysis_limit acota lo que ANALYZE lee de cada índice, así no crece con la base
+    conn.execute("PRAGMA analysis_limit = 400")
+    conn.execute("ANALYZE")
+
+
+def _truncar_wal(conn, limite, vacuum_completo):
+    ocupado, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if ocupado:
+        return "hay lectores activos, se reintentará"
+
+
+def _modo_auto_vacuum(gestor):
+    with gestor.escritor() as conn:
+        # PRAGMA auto_vacuum responde lo que la conexión leyó la última vez: tras un VACUUM
+        # de otra terminal sólo se actualiza al volver a leer la base
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+
+def _vacuum_incremental(gestor, limite, vacuum_completo):
+    if _modo_auto_vacuum(gestor) == 2:
+        liberadas = 0
+        while time.monotonic() < limite:
+            # El candado del escritor se suelta entre tandas para dejar pasar las ventas
+            with gestor.escritor() as conn:
+                libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not libres:
+                    break
+                # execute() avanza el PRAGMA un solo paso (una página); executescript lo corre completo
+                conn.executescript(f"PRAGMA incremental_vacuum({PAGINAS_VACUUM})")
+            liberadas += min(libres, PAGINAS_VACUUM)
+        return f"{liberadas} páginas liberadas"
+    if not vacuum_completo:
+        return "pendiente activar auto_vacuum (se hace tras el cierre de caja)"
+    # Las demás terminales sólo esperan espera_ms antes de fallar
+    tamano = gestor.consultar_uno("PRAGMA page_count")[0] * gestor.consultar_uno("PRAGMA page_size")[0]
+    disponible = min(limite - time.monotonic(), gestor.espera_ms / 1000)
+    if tamano / BYTES_POR_SEGUNDO_VACUUM > disponible:
+        return (f"base de {tamano // (1024 * 1024)} MB, el VACUUM completo no cabe en {disponible:.1f}s: "
+                "ejecute 'python mantenimiento.py <ruta_db> vacuum' con las cajas cerradas")
+    compactar(gestor)
+    return "auto_vacuum incremental activado"
+
+
+def _activar_auto_vacuum(conn):
+    # Cambiar auto_vacuum en una base existente requiere un VACUUM completo, una sola vez
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+# (nombre, función, escribe). Los pasos que escriben reciben el gestor y toman su candado
+# sólo por tandas; los demás reciben una conexión propia (ver _conexion_aparte).
+PASOS = [
+    ("registro_cambios", _podar_registro, True),
+    ("optimize", _optimizar, False),
+    ("analyze", _analizar, False),
+    ("wal_checkpoint", _truncar_wal, False),
+    ("incremental_vacuum", _vacuum_incremental, True),
+]
+
+
+def _conexion_aparte(gestor, limite):
+    """ Conexión sólo para el mantenimiento, que espera a los demás como mucho ESPERA_MANTENIMIENTO. """
+    if gestor.ruta == ":memory:":
+        return None
+    espera = max(0.0, min(ESPERA_MANTENIMIENTO, limite - time.monotonic()))
+    return sqlite3.connect(gestor.ruta, isolation_level=None, check_same_thread=False, timeout=espera)
+
+
+def mantener(gestor, presupuesto=2.0, vacuum_completo=False):
+    """ Ejecuta los pasos de mantenimiento mientras quede presupuesto (segundos).
+
+    Devuelve una lista de (paso, segundos, nota); los pasos omitidos tienen segundos None.
+    """
+    limite = time.monotonic() + presupuesto
+    registro = []
+    conn = None
+    try:
+        for nombre, paso, escribe in PASOS:
+            if time.monotonic() >= limite:
+                registro.append((nombre, None, "omitido por tiempo"))
+                continue
+            comienzo = time.monotonic()
+            try:
+                if escribe:
+                    nota = paso(gestor, limite, vacuum_completo)
+                else:
+                    if conn is None:
+                        conn = _conexion_aparte(gestor, limite)
+                    if conn is None:
+                        # Una base en memoria sólo tiene la conexión del gestor
+                        with gestor.escritor() as escritor:
+                            nota = paso(escritor, limite, vacuum_completo)
+                    else:
+                        nota = paso(conn, limite, vacuum_completo)
+            except Exception as e:
+                nota = f"ERROR: {e}"
+            registro.append((nombre, time.monotonic() - comienzo, nota))
+    finally:
+        if conn is not None:
+            conn.close()
+    for nombre, segundos, nota in registro:
+        duracion = "   -   " if segundos is None else f"{segundos:6.3f}s"
+        print(f"Mantenimiento {nombre:<20} {duracion}" + (f"  ({nota})" if nota else ""))
+    return registro
+
+
+def compactar(gestor):
+    """ VACUUM completo sin límite de tiempo, activando auto_vacuum incremental. Bloquea la base mientras dura. """
+    with gestor.escritor() as conn:
+        _activar_auto_vacuum(conn)
+
+
+class ServicioMantenimiento(threading.Thread):
+    """ Hilo que ejecuta mantener() cuando se le pide, sin bloquear la interfaz. """
+
+    def __init__(self, gestor, presupuesto=2.0):
+        super().__init__(name="ServicioMantenimiento", daemon=True)
+        self.gestor = gestor
+        self.presupuesto = presupuesto
+        self._solicitudes = queue.Queue()
+
+    def solicitar(self, vacuum_completo=False, despues=None):
+        """ despues() se llama desde este hilo al terminar (p. ej. para pedir un respaldo). """
+        self._solicitudes.put((vacuum_completo, despues))
+
+    def run(self):
+        while True:
+            solicitud = self._solicitudes.get()
+            if solicitud is None:
+                break
+            vacuum_completo, despues = solicitud
+            mantener(self.gestor, self.presupuesto, vacuum_completo)
+            if despues:
+                despues()
+
+    def detener(self):
+        self._solicitudes.put(None)
+        self.join()
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) >= 3 and sys.argv[2] == "vacuum":
+        gestor = GestorBD(sys.argv[1])
+        aplicar_migraciones(gestor)
+        inicio = time.monotonic()
+        compactar(gestor)
+        print(f"VACUUM completo en {time.monotonic() - inicio:.1f}s")
+        gestor.cerrar()
+    else:
+        print(__doc__)
+        sys.exit(1)
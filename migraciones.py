@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+Cada migración se aplica una sola vez, en orden y dentro de su propia transacción,
+y queda registrada en la tabla Version_Esquema. Nunca se borran datos: sólo se
+crean tablas, columnas e índices sobre la base existente.
+"""
+import datetime
+import re
+
+
+def _m001_esquema_base(cursor):
+    # Mismo esquema que creaba crear_db.py; en bases existentes no hace nada.
+    cursor.execute('CREATE TABLE IF NOT EXISTS Categorias (id INTEGER PRIMARY KEY, nombre TEXT NOT NULL UNIQUE)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Productos (
+            id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE,
+            precio REAL NOT NULL,
+            id_categoria INTEGER,
+            precio_variable BOOLEAN DEFAULT 0,
+            FOREIGN KEY (id_categoria) REFERENCES Categorias(id)
+        )''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Ventas (
+            id INTEGER PRIMARY KEY,
+            id_mesa INTEGER NOT NULL,
+            total REAL NOT NULL,
+            metodo_pago TEXT,
+            descuento REAL DEFAULT 0,
+            paga_con REAL DEFAULT 0,
+            corte_id TEXT,
+            fecha_hora TIMESTAMP
+        )''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Detalle_Venta (
+            id INTEGER PRIMARY KEY,
+            id_venta INTEGER,
+            id_producto INTEGER,
+            cantidad INTEGER NOT NULL,
+            precio_unitario REAL NOT NULL,
+            FOREIGN KEY (id_venta) REFERENCES Ventas(id),
+            FOREIGN KEY (id_producto) REFERENCES Productos(id)
+        )''')
+
+
+def _m002_indices_reportes(cursor):
+    # Índices que usan el corte de caja, el historial y el recibo final.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha_hora ON Ventas(fecha_hora)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_corte ON Ventas(corte_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalle_venta_venta ON Detalle_Venta(id_venta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalle_venta_producto ON Detalle_Venta(id_producto)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_categoria ON Productos(id_categoria)")
+
+
+def _m003_fecha_negocio(cursor):
+    # Día contable y marca de tiempo guardados al insertar, para filtrar por índice y no con DATE(fecha_hora).
+    cursor.execute("ALTER TABLE Ventas ADD COLUMN fecha_negocio TEXT")
+    cursor.execute("ALTER TABLE Ventas ADD COLUMN fecha_epoch INTEGER")
+    # Las ventas anteriores se cerraban por día natural, así que su día contable es DATE(fecha_hora).
+    cursor.execute("UPDATE Ventas SET fecha_negocio = DATE(fecha_hora), fecha_epoch = CAST(strftime('%s', fecha_hora, 'utc') AS INTEGER)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha_negocio ON Ventas(fecha_negocio, corte_id)")
+
+
+def _m004_resumen_diario(cursor):
+    # Totales por día contable y corte ('' = ventas aún sin corte), mantenidos por triggers
+    # en la misma transacción que cada venta.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Resumen_Diario (
+            fecha_negocio TEXT NOT NULL,
+            corte_id TEXT NOT NULL DEFAULT '',
+            num_tickets INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            total_efectivo REAL NOT NULL DEFAULT 0,
+            total_tarjeta REAL NOT NULL DEFAULT 0,
+            total_descuento REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha_negocio, corte_id)
+        ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_diario_corte ON Resumen_Diario(corte_id)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_resumen_insertar AFTER INSERT ON Ventas
+        BEGIN
+            INSERT INTO Resumen_Diario (fecha_negocio, corte_id, num_tickets, total, total_efectivo, total_tarjeta, total_descuento)
+            VALUES (COALESCE(NEW.fecha_negocio, DATE(NEW.fecha_hora)), COALESCE(NEW.corte_id, ''), 1, NEW.total,
+                    CASE WHEN NEW.metodo_pago = 'Efectivo' THEN NEW.total ELSE 0 END,
+                    CASE WHEN NEW.metodo_pago = 'Tarjeta' THEN NEW.total ELSE 0 END,
+                    COALESCE(NEW.descuento, 0))
+            ON CONFLICT (fecha_negocio, corte_id) DO UPDATE SET
+                num_tickets = num_tickets + excluded.num_tickets,
+                total = total + excluded.total,
+                total_efectivo = total_efectivo + excluded.total_efectivo,
+                total_tarjeta = total_tarjeta + excluded.total_tarjeta,
+                total_descuento = total_descuento + excluded.total_descuento;
+        END''')
+    # Al cerrar caja (o corregir una venta) el importe pasa de la fila anterior a la nueva
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_resumen_actualizar
+        AFTER UPDATE OF corte_id, fecha_negocio, total, metodo_pago, descuento ON Ventas
+        BEGIN
+            UPDATE Resumen_Diario SET
+                num_tickets = num_tickets - 1,
+                total = total - OLD.total,
+                total_efectivo = total_efectivo - CASE WHEN OLD.metodo_pago = 'Efectivo' THEN OLD.total ELSE 0 END,
+                total_tarjeta = total_tarjeta - CASE WHEN OLD.metodo_pago = 'Tarjeta' THEN OLD.total ELSE 0 END,
+                total_descuento = total_descuento - COALESCE(OLD.descuento, 0)
+            WHERE fecha_negocio = COALESCE(OLD.fecha_negocio, DATE(OLD.fecha_hora)) AND corte_id = COALESCE(OLD.corte_id, '');
+            DELETE FROM Resumen_Diario
+            WHERE fecha_negocio = COALESCE(OLD.fecha_negocio, DATE(OLD.fecha_hora)) AND corte_id = COALESCE(OLD.corte_id, '') AND num_tickets <= 0;
+            INSERT INTO Resumen_Diario (fecha_negocio, corte_id, num_tickets, total, total_efectivo, total_tarjeta, total_descuento)
+            VALUES (COALESCE(NEW.fecha_negocio, DATE(NEW.fecha_hora)), COALESCE(NEW.corte_id, ''), 1, NEW.total,
+                    CASE WHEN NEW.metodo_pago = 'Efectivo' THEN NEW.total ELSE 0 END,
+                    CASE WHEN NEW.metodo_pago = 'Tarjeta' THEN NEW.total ELSE 0 END,
+                    COALESCE(NEW.descuento, 0))
+            ON CONFLICT (fecha_negocio, corte_id) DO UPDATE SET
+                num_tickets = num_tickets + excluded.num_tickets,
+                total = total + excluded.total,
+                total_efectivo = total_efectivo + excluded.total_efectivo,
+                total_tarjeta = total_tarjeta + excluded.total_tarjeta,
+                total_descuento = total_descuento + excluded.total_descuento;
+        END''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO Resumen_Diario (fecha_negocio, corte_id, num_tickets, total, total_efectivo, total_tarjeta, total_descuento)
+        SELECT COALESCE(fecha_negocio, DATE(fecha_hora)), COALESCE(corte_id, ''), COUNT(*), SUM(total),
+               SUM(CASE WHEN metodo_pago = 'Efectivo' THEN total ELSE 0 END),
+               SUM(CASE WHEN metodo_pago = 'Tarjeta' THEN total ELSE 0 END),
+               SUM(COALESCE(descuento, 0))
+        FROM Ventas GROUP BY 1, 2''')
+
+
+def _m005_resumen_productos(cursor):
+    # Cantidad e ingreso por producto, día contable y corte. Guarda el nombre con el que se vendió,
+    # así el reporte no depende de que el producto siga existiendo o conserve su nombre.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Resumen_Producto_Diario (
+            fecha_negocio TEXT NOT NULL,
+            corte_id TEXT NOT NULL DEFAULT '',
+            id_producto INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            ingreso REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha_negocio, corte_id, id_producto)
+        ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_producto_corte ON Resumen_Producto_Diario(corte_id)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_detalle_resumen_producto_insertar AFTER INSERT ON Detalle_Venta
+        BEGIN
+            INSERT INTO Resumen_Producto_Diario (fecha_negocio, corte_id, id_producto, nombre, cantidad, ingreso)
+            SELECT COALESCE(v.fecha_negocio, DATE(v.fecha_hora)), COALESCE(v.corte_id, ''), NEW.id_producto,
+                   COALESCE((SELECT nombre FROM Productos WHERE id = NEW.id_producto), 'Producto #' || NEW.id_producto),
+                   NEW.cantidad, NEW.cantidad * NEW.precio_unitario
+            FROM Ventas v WHERE v.id = NEW.id_venta
+            ON CONFLICT (fecha_negocio, corte_id, id_producto) DO UPDATE SET
+                cantidad = cantidad + excluded.cantidad,
+                ingreso = ingreso + excluded.ingreso;
+        END''')
+    # Si la venta cambia de corte o de día, sus líneas se trasladan a la fila correspondiente
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ventas_resumen_producto_mover AFTER UPDATE OF corte_id, fecha_negocio ON Ventas
+        WHEN COALESCE(OLD.corte_id, '') <> COALESCE(NEW.corte_id, '') OR OLD.fecha_negocio IS NOT NEW.fecha_negocio
+        BEGIN
+            INSERT INTO Resumen_Producto_Diario (fecha_negocio, corte_id, id_producto, nombre, cantidad, ingreso)
+            SELECT COALESCE(NEW.fecha_negocio, DATE(NEW.fecha_hora)), COALESCE(NEW.corte_id, ''), d.id_producto,
+                   COALESCE((SELECT r.nombre FROM Resumen_Producto_Diario r
+                             WHERE r.fecha_negocio = COALESCE(OLD.fecha_negocio, DATE(OLD.fecha_hora))
+                               AND r.corte_id = COALESCE(OLD.corte_id, '') AND r.id_producto = d.id_producto),
+                            'Producto #' || d.id_producto),
+                   SUM(d.cantidad), SUM(d.cantidad * d.precio_unitario)
+            FROM Detalle_Venta d WHERE d.id_venta = NEW.id GROUP BY d.id_producto
+            ON CONFLICT (fecha_negocio, corte_id, id_producto) DO UPDATE SET
+                cantidad = cantidad + excluded.cantidad,
+                ingreso = ingreso + excluded.ingreso;
+            UPDATE Resumen_Producto_Diario SET
+                cantidad = cantidad - (SELECT SUM(d.cantidad) FROM Detalle_Venta d WHERE d.id_venta = OLD.id AND d.id_producto = Resumen_Producto_Diario.id_producto),
+                ingreso = ingreso - (SELECT SUM(d.cantidad * d.precio_unitario) FROM Detalle_Venta d WHERE d.id_venta = OLD.id AND d.id_producto = Resumen_Producto_Diario.id_producto)
+            WHERE fecha_negocio = COALESCE(OLD.fecha_negocio, DATE(OLD.fecha_hora)) AND corte_id = COALESCE(OLD.corte_id, '')
+              AND id_producto IN (SELECT id_producto FROM Detalle_Venta WHERE id_venta = OLD.id);
+            DELETE FROM Resumen_Producto_Diario
+            WHERE fecha_negocio = COALESCE(OLD.fecha_negocio, DATE(OLD.fecha_hora)) AND corte_id = COALESCE(OLD.corte_id, '')
+              AND cantidad <= 0;
+        END''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO Resumen_Producto_Diario (fecha_negocio, corte_id, id_producto, nombre, cantidad, ingreso)
+        SELECT COALESCE(v.fecha_negocio, DATE(v.fecha_hora)), COALESCE(v.corte_id, ''), d.id_producto,
+               COALESCE(p.nombre, 'Producto #' || d.id_producto), SUM(d.cantidad), SUM(d.cantidad * d.precio_unitario)
+        FROM Detalle_Venta d
+        JOIN Ventas v ON d.id_venta = v.id
+        LEFT JOIN Productos p ON d.id_producto = p.id
+        GROUP BY 1, 2, 3''')
+
+
+def _m006_cortes(cursor):
+    # Cada cierre de caja guarda su rango de ventas y los totales congelados; cerrar ya no
+    # actualiza cada fila de Ventas. El corte se identifica con su día contable (YYYY-MM-DD).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Cortes (
+            corte_id TEXT PRIMARY KEY,
+            fecha_negocio TEXT NOT NULL,
+            id_venta_desde INTEGER NOT NULL,
+            id_venta_hasta INTEGER NOT NULL,
+            abierto_en TIMESTAMP,
+            cerrado_en TIMESTAMP,
+            num_tickets INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            total_efectivo REAL NOT NULL DEFAULT 0,
+            total_tarjeta REAL NOT NULL DEFAULT 0,
+            total_descuento REAL NOT NULL DEFAULT 0
+        )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cortes_fecha_negocio ON Cortes(fecha_negocio)")
+    # Los cortes hechos antes de esta versión se reconstruyen desde Ventas.corte_id
+    cursor.execute('''
+        INSERT OR IGNORE INTO Cortes (corte_id, fecha_negocio, id_venta_desde, id_venta_hasta, abierto_en, cerrado_en,
+                                      num_tickets, total, total_efectivo, total_tarjeta, total_descuento)
+        SELECT corte_id, MIN(COALESCE(fecha_negocio, DATE(fecha_hora))), MIN(id), MAX(id), MIN(fecha_hora), MAX(fecha_hora),
+               COUNT(*), SUM(total),
+               SUM(CASE WHEN metodo_pago = 'Efectivo' THEN total ELSE 0 END),
+               SUM(CASE WHEN metodo_pago = 'Tarjeta' THEN total ELSE 0 END),
+               SUM(COALESCE(descuento, 0))
+        FROM Ventas WHERE corte_id IS NOT NULL GROUP BY corte_id''')
+
+
+def _m007_cortes_archivados(cursor):
+    # Año del archivo histórico (pos_archivo_AAAA.db) al que se movieron las ventas del corte
+    cursor.execute("ALTER TABLE Cortes ADD COLUMN archivo INTEGER")
+
+
+def _m008_version_catalogo(cursor):
+    # Contador que sube con cualquier cambio en Categorias o Productos; la caché del catálogo
+    # lo compara para saber si debe recargarse (las ventas no lo modifican).
+    cursor.execute("CREATE TABLE IF NOT EXISTS Version_Catalogo (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO Version_Catalogo (id, version) VALUES (1, 0)")
+    for tabla in ("Categorias", "Productos"):
+        for evento in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_version_catalogo_{tabla.lower()}_{evento.lower()} AFTER {evento} ON {tabla}
+                BEGIN
+                    UPDATE Version_Catalogo SET version = version + 1 WHERE id = 1;
+                END''')
+
+
+def _m009_busqueda_productos(cursor):
+    # Índice FTS5 de nombre de producto y de su categoría. remove_diacritics hace que
+    # "camaron" encuentre "camarón"; los triggers lo mantienen igual a Productos (rowid = id).
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS Busqueda_Productos USING fts5(
+            nombre, categoria,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_productos_insertar AFTER INSERT ON Productos
+        BEGIN
+            INSERT INTO Busqueda_Productos (rowid, nombre, categoria)
+            VALUES (NEW.id, NEW.nombre, (SELECT nombre FROM Categorias WHERE id = NEW.id_categoria));
+        END''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_productos_actualizar AFTER UPDATE OF id, nombre, id_categoria ON Productos
+        BEGIN
+            DELETE FROM Busqueda_Productos WHERE rowid = OLD.id;
+            INSERT INTO Busqueda_Productos (rowid, nombre, categoria)
+            VALUES (NEW.id, NEW.nombre, (SELECT nombre FROM Categorias WHERE id = NEW.id_categoria));
+        END''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_productos_eliminar AFTER DELETE ON Productos
+        BEGIN
+            DELETE FROM Busqueda_Productos WHERE rowid = OLD.id;
+        END''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_categorias_renombrar AFTER UPDATE OF nombre ON Categorias
+        BEGIN
+            UPDATE Busqueda_Productos SET categoria = NEW.nombre
+            WHERE rowid IN (SELECT id FROM Productos WHERE id_categoria = NEW.id);
+        END''')
+    cursor.execute("DELETE FROM Busqueda_Productos")
+    cursor.execute('''
+        INSERT INTO Busqueda_Productos (rowid, nombre, categoria)
+        SELECT p.id, p.nombre, c.nombre FROM Productos p LEFT JOIN Categorias c ON p.id_categoria = c.id''')
+
+
+# Columnas con importes; desde la migración 10 guardan centavos enteros
+COLUMNAS_DINERO = {
+    "Productos": ("precio",),
+    "Ventas": ("total", "descuento", "paga_con"),
+    "Detalle_Venta": ("precio_unitario",),
+    "Resumen_Diario": ("total", "total_efectivo", "total_tarjeta", "total_descuento"),
+    "Resumen_Producto_Diario": ("ingreso",),
+    "Cortes": ("total", "total_efectivo", "total_tarjeta", "total_descuento"),
+}
+
+
+def _con_esquema(sql, esquema):
+    # 'CREATE INDEX x ON ...' -> 'CREATE INDEX esquema.x ON ...' (igual para triggers)
+    return re.sub(r"^(\s*CREATE\s+(?:UNIQUE\s+)?(?:INDEX|TRIGGER)\s+(?:IF\s+NOT\s+EXISTS\s+)?)", rf"\g<1>{esquema}.", sql, count=1, flags=re.I)
+
+
+def convertir_a_centavos(cursor, tabla, esquema="main"):
+    """ Reconstruye la tabla con sus columnas de importe como INTEGER y los valores en centavos.
+
+    SQLite no permite cambiar el tipo de una columna: se crea la tabla nueva, se copian
+    las filas, se borra la anterior y se recrean sus índices y triggers.
+    """
+    columnas_dinero = COLUMNAS_DINERO[tabla]
+    cursor.execute(f"SELECT sql FROM {esquema}.sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+    sql = cursor.fetchone()[0]
+    cursor.execute(f"SELECT sql FROM {esquema}.sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? AND sql IS NOT NULL", (tabla,))
+    dependientes = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute(f"PRAGMA {esquema}.table_info({tabla})")
+    columnas = [fila[1] for fila in cursor.fetchall()]
+
+    nueva = f"{tabla}_centavos"
+    sql = re.sub(r"^\s*CREATE TABLE\s+(IF NOT EXISTS\s+)?\S+", f"CREATE TABLE {esquema}.{nueva}", sql, count=1)
+    for columna in columnas_dinero:
+        sql = re.sub(rf"\b({columna}\s+)REAL\b", r"\1INTEGER", sql)
+    cursor.execute(sql)
+    lista = ", ".join(columnas)
+    valores = ", ".join(f"CAST(ROUND({c} * 100) AS INTEGER)" if c in columnas_dinero else c for c in columnas)
+    cursor.execute(f"INSERT INTO {esquema}.{nueva} ({lista}) SELECT {valores} FROM {esquema}.{tabla}")
+    cursor.execute(f"DROP TABLE {esquema}.{tabla}")
+    # Sin legacy_alter_table el RENAME revisa todos los triggers y falla por los que
+    # mencionan la tabla recién borrada (p. ej. los de Detalle_Venta que leen Ventas).
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(f"ALTER TABLE {esquema}.{nueva} RENAME TO {tabla}")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    for sql_dependiente in dependientes:
+        cursor.execute(_con_esquema(sql_dependiente, esquema))
+
+
+def _m010_importes_en_centavos(cursor):
+    # Los importes REAL acumulaban errores de redondeo en las sumas; se pasan a centavos enteros.
+    for tabla in COLUMNAS_DINERO:
+        convertir_a_centavos(cursor, tabla)
+
+
+def compactar_detalle_venta(cursor, esquema="main"):
+    """ Reescribe Detalle_Venta agrupada por venta (WITHOUT ROWID, clave (id_venta, linea)) y con
+    el nombre y la categoría del producto copiados en cada línea.
+
+    Los nombres se toman del catálogo actual de la base principal; las líneas de productos
+    que ya no existen quedan como 'Producto #id'.
+    """
+    cursor.execute(f'''
+        CREATE TABLE {esquema}.Detalle_Venta_nueva (
+            id_venta INTEGER NOT NULL,
+            linea INTEGER NOT NULL,
+            id_producto INTEGER,
+            nombre TEXT NOT NULL,
+            categoria TEXT,
+            cantidad INTEGER NOT NULL,
+            precio_unitario INTEGER NOT NULL,
+            PRIMARY KEY (id_venta, linea)
+        ) WITHOUT ROWID''')
+    cursor.execute(f'''
+        INSERT INTO {esquema}.Detalle_Venta_nueva (id_venta, linea, id_producto, nombre, categoria, cantidad, precio_unitario)
+        SELECT d.id_venta, ROW_NUMBER() OVER (PARTITION BY d.id_venta ORDER BY d.id), d.id_producto,
+               COALESCE(p.nombre, 'Producto #' || d.id_producto), c.nombre, d.cantidad, d.precio_unitario
+        FROM {esquema}.Detalle_Venta d
+        LEFT JOIN main.Productos p ON d.id_producto = p.id
+        LEFT JOIN main.Categorias c ON p.id_categoria = c.id''')
+    cursor.execute(f"DROP TABLE {esquema}.Detalle_Venta")
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(f"ALTER TABLE {esquema}.Detalle_Venta_nueva RENAME TO Detalle_Venta")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_detalle_venta_producto ON Detalle_Venta(id_producto)")
+
+
+def _m011_detalle_venta_compacto(cursor):
+    # Las líneas de una venta quedan contiguas en disco y no dependen de que el producto siga
+    # existiendo; el recibo se lee sin JOIN. La clave primaria sustituye a idx_detalle_venta_venta.
+    compactar_detalle_venta(cursor)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_detalle_resumen_producto_insertar AFTER INSERT ON Detalle_Venta
+        BEGIN
+            INSERT INTO Resumen_Producto_Diario (fecha_negocio, corte_id, id_producto, nombre, cantidad, ingreso)
+            SELECT COALESCE(v.fecha_negocio, DATE(v.fecha_hora)), COALESCE(v.corte_id, ''), NEW.id_producto,
+                   NEW.nombre, NEW.cantidad, NEW.cantidad * NEW.precio_unitario
+            FROM Ventas v WHERE v.id = NEW.id_venta
+            ON CONFLICT (fecha_negocio, corte_id, id_producto) DO UPDATE SET
+                cantidad = cantidad + excluded.cantidad,
+                ingreso = ingreso + excluded.ingreso;
+        END''')
+
+
+def _m012_ventas_importadas(cursor):
+    # Ventas copiadas desde otra base (origen = nombre de la base o terminal) con su id original,
+    # para que repetir una importación no las duplique.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Ventas_Importadas (
+            origen TEXT NOT NULL,
+            id_origen INTEGER NOT NULL,
+            id_venta INTEGER NOT NULL,
+            PRIMARY KEY (origen, id_origen)
+        ) WITHOUT ROWID''')
+
+
+def _m013_sucursales(cursor):
+    # Base consolidada: cada venta traída de una sucursal lleva su nombre; las locales quedan en NULL.
+    # ultima_venta es la marca de agua: el id más alto ya copiado de esa sucursal.
+    cursor.execute("ALTER TABLE Ventas ADD COLUMN sucursal TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_sucursal ON Ventas(sucursal, corte_id, fecha_negocio)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Sucursales (
+            sucursal TEXT PRIMARY KEY,
+            ruta TEXT,
+            ultima_venta INTEGER NOT NULL DEFAULT 0,
+            sincronizado_en TIMESTAMP
+        )''')
+
+
+# Tablas cuyos cambios se copian a la base de respaldo en espera, con su clave primaria
+TABLAS_REPLICADAS = {
+    "Categorias": ("id",),
+    "Productos": ("id",),
+    "Ventas": ("id",),
+    "Detalle_Venta": ("id_venta", "linea"),
+    "Cortes": ("corte_id",),
+}
+
+
+def crear_triggers_registro(cursor):
+    """ (Re)crea los triggers que anotan en Registro_Cambios cada fila insertada, modificada o borrada.
+
+    Sólo anotan mientras Estado_Registro.activo está encendido (migración 16), es decir,
+    mientras alguna terminal envía la bitácora a una base en espera.
+    Las migraciones que añadan columnas a TABLAS_REPLICADAS deben volver a llamarla.
+    """
+    def objeto(prefijo, columnas):
+        return "json_object(" + ", ".join(f"'{c}', {prefijo}.{c}" for c in columnas) + ")"
+
+    for tabla, clave in TABLAS_REPLICADAS.items():
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        columnas = [fila[1] for fila in cursor.fetchall()]
+        for evento, operacion, sql_clave, sql_datos in (
+                ("INSERT", "I", objeto("NEW", clave), objeto("NEW", columnas)),
+                ("UPDATE", "U", objeto("OLD", clave), objeto("NEW", columnas)),
+                ("DELETE", "D", objeto("OLD", clave), "NULL")):
+            nombre = f"trg_registro_{tabla.lower()}_{evento.lower()}"
+            cursor.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+            cursor.execute(f'''
+                CREATE TRIGGER {nombre} AFTER {evento} ON {tabla}
+                WHEN (SELECT activo FROM Estado_Registro WHERE id = 1)
+                BEGIN
+                    INSERT INTO Registro_Cambios (tabla, operacion, clave, datos) VALUES ('{tabla}', '{operacion}', {sql_clave}, {sql_datos});
+                END''')
+
+
+def _m014_registro_cambios(cursor):
+    # Bitácora de sólo inserción con cada venta y cambio del catálogo, en orden de commit.
+    # replica.py la aplica en una base en espera y borra lo ya aplicado; AUTOINCREMENT evita
+    # que se reutilicen ids al vaciarla, así la réplica detecta si le faltan cambios.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Registro_Cambios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            operacion TEXT NOT NULL,
+            clave TEXT,
+            datos TEXT
+        )''')
+    crear_triggers_registro(cursor)
+
+
+def _m015_terminal(cursor):
+    # Varias cajas comparten la base: cada venta guarda qué terminal la registró
+    cursor.execute("ALTER TABLE Ventas ADD COLUMN terminal TEXT")
+    crear_triggers_registro(cursor)
+
+
+def _m016_estado_registro(cursor):
+    # La bitácora sólo se llena mientras una terminal la envía a la base en espera:
+    # replica.enviar_cambios la enciende y anota enviado_en en cada envío, y el
+    # mantenimiento la apaga y la vacía si lleva días sin enviarse.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Estado_Registro (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            activo INTEGER NOT NULL DEFAULT 0,
+            enviado_en TIMESTAMP
+        )''')
+    cursor.execute("INSERT OR IGNORE INTO Estado_Registro (id, activo) VALUES (1, 0)")
+    # La bitácora arranca apagada y se vacía: una base en espera que ya existiera se vuelve
+    # a copiar completa en su siguiente envío (replica.enviar_cambios lo avisa al encenderla)
+    cursor.execute("SELECT COUNT(*) FROM Registro_Cambios")
+    pendientes = cursor.fetchone()[0]
+    cursor.execute("DELETE FROM Registro_Cambios")
+    if pendientes:
+        print(f"ADVERTENCIA: Bitácora de cambios vaciada ({pendientes} cambios sin enviar); "
+              "las bases en espera existentes se copiarán completas en su próximo envío.")
+    crear_triggers_registro(cursor)
+
+
+def _m017_productos_autoincrement(cursor):
+    # Resumen_Producto_Diario y Detalle_Venta identifican el producto por id: sin AUTOINCREMENT
+    # SQLite reutiliza el id del último producto borrado y el resumen del día juntaría dos
+    # productos distintos bajo un mismo nombre. Se reconstruye la tabla como en convertir_a_centavos.
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Productos'")
+    sql = cursor.fetchone()[0]
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = 'Productos' AND sql IS NOT NULL")
+    dependientes = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute("PRAGMA table_info(Productos)")
+    lista = ", ".join(fila[1] for fila in cursor.fetchall())
+    sql = re.sub(r"^\s*CREATE TABLE\s+(IF NOT EXISTS\s+)?\S+", "CREATE TABLE Productos_nueva", sql, count=1)
+    sql = re.sub(r"\bid\s+INTEGER\s+PRIMARY\s+KEY\b(?!\s+AUTOINCREMENT)", "id INTEGER PRIMARY KEY AUTOINCREMENT", sql, count=1, flags=re.I)
+    cursor.execute(sql)
+    cursor.execute(f"INSERT INTO Productos_nueva ({lista}) SELECT {lista} FROM Productos")
+    cursor.execute("DROP TABLE Productos")
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute("ALTER TABLE Productos_nueva RENAME TO Productos")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    for sql_dependiente in dependientes:
+        cursor.execute(sql_dependiente)
+    # Los ids de productos ya borrados que siguen en el historial tampoco se vuelven a usar
+    cursor.execute('''
+        SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM Productos
+                             UNION ALL SELECT MAX(id_producto) FROM Detalle_Venta
+                             UNION ALL SELECT MAX(id_producto) FROM Resumen_Producto_Diario)''')
+    maximo = cursor.fetchone()[0] or 0
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'Productos'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('Productos', ?)", (maximo,))
+
+
+# (versión, descripción, función). Las nuevas migraciones se añaden siempre al final.
+MIGRACIONES = [
+    (1, "Esquema base", _m001_esquema_base),
+    (2, "Índices para reportes y recibos", _m002_indices_reportes),
+    (3, "Día contable indexado en Ventas", _m003_fecha_negocio),
+    (4, "Resumen diario de ventas mantenido por triggers", _m004_resumen_diario),
+    (5, "Resumen diario por producto", _m005_resumen_productos),
+    (6, "Tabla de cortes de caja con rango de ventas", _m006_cortes),
+    (7, "Marca de archivo anual en Cortes", _m007_cortes_archivados),
+    (8, "Versión del catálogo para la caché en memoria", _m008_version_catalogo),
+    (9, "Búsqueda de productos sin acentos (FTS5)", _m009_busqueda_productos),
+    (10, "Importes en centavos enteros", _m010_importes_en_centavos),
+    (11, "Detalle de venta compacto con nombre y categoría del producto", _m011_detalle_venta_compacto),
+    (12, "Registro de ventas importadas de otras bases", _m012_ventas_importadas),
+    (13, "Sucursal de cada venta para la base consolidada", _m013_sucursales),
+    (14, "Bitácora de cambios para la base en espera", _m014_registro_cambios),
+    (15, "Terminal que registró cada venta", _m015_terminal),
+    (16, "Bitácora de cambios sólo con base en espera configurada", _m016_estado_registro),
+    (17, "Ids de productos sin reutilizar (AUTOINCREMENT)", _m017_productos_autoincrement),
+]
+
+
+def version_actual(gestor):
+    with gestor.transaccion() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS Version_Esquema (version INTEGER PRIMARY KEY, descripcion TEXT, aplicada_en TIMESTAMP)")
+        cursor.execute("SELECT MAX(version) FROM Version_Esquema")
+        return cursor.fetchone()[0] or 0
+
+
+def aplicar_migraciones(gestor):
+    """ Aplica en orden las migraciones pendientes y devuelve la versión final del esquema. """
+    version = version_actual(gestor)
+    for numero, descripcion, migracion in MIGRACIONES:
+        if numero <= version:
+            continue
+        with gestor.transaccion() as cursor:
+            # Otra terminal pudo haber aplicado la misma migración mientras tanto.
+            cursor.execute("SELECT 1 FROM Version_Esquema WHERE version = ?", (numero,))
+            if cursor.fetchone():
+                continue
+            migracion(cursor)
+            cursor.execute("INSERT INTO Version_Esquema (version, descripcion, aplicada_en) VALUES (?, ?, ?)",
+                           (numero, descripcion, datetime.datetime.now()))
+        print(f"Migración {numero:03d} aplicada: {descripcion}")
+        version = numero
+    return version
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Base en espera: una copia de la base principal en otro disco o memoria USB que se
+mantiene al día aplicando la bitácora Registro_Cambios (migración 14).
+
+La bitácora sólo se llena mientras está encendida (Estado_Registro, migración 16):
+el primer envío la enciende y copia la base completa con la API de backup; después
+sólo se envían las filas nuevas, así que la copia va unos segundos atrás de la
+principal. Lo ya aplicado se borra de la bitácora principal. Si nadie la envía en
+varios días el mantenimiento la apaga y la vacía, y el siguiente envío vuelve a
+copiar todo. Si el disco principal falla, la copia se convierte en principal con
+el comando promover.
+
+Uso como script:
+    python replica.py enviar <ruta_db> <ruta_replica>
+    python replica.py promover <ruta_replica> [ruta_nueva_principal]
+    python replica.py desactivar <ruta_db>
+"""
+import datetime
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+
+from reportes import trasladar_resumenes_a_corte
+
+
+def es_replica(gestor):
+    """ True si la base es una copia en espera que todavía no se ha promovido. """
+    return gestor.consultar_uno("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'Estado_Replica'")[0] > 0
+
+
+def crear_replica(ruta_db, ruta_replica, paginas=256):
+    """ Copia completa de la base en ruta_replica, anotando el último cambio de la bitácora que incluye. """
+    destino_temporal = ruta_replica + ".tmp"
+    origen = sqlite3.connect(ruta_db, isolation_level=None)
+    destino = sqlite3.connect(destino_temporal, isolation_level=None)
+    try:
+        # La lectura del último cambio y la copia ven la misma instantánea
+        origen.execute("BEGIN")
+        # El último id asignado, aunque ya se haya borrado de la bitácora
+        ultimo = origen.execute(
+            "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Registro_Cambios'), 0)").fetchone()[0]
+        origen.backup(destino, pages=paginas)
+        origen.execute("COMMIT")
+        destino.execute("BEGIN")
+        destino.execute("UPDATE Estado_Registro SET activo = 0, enviado_en = NULL WHERE id = 1")
+        destino.execute("DELETE FROM Registro_Cambios")
+        destino.execute('''
+            CREATE TABLE Estado_Replica (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                ultimo_cambio INTEGER NOT NULL,
+                actualizado_en TIMESTAMP
+            )''')
+        destino.execute("INSERT INTO Estado_Replica (id, ultimo_cambio, actualizado_en) VALUES (1, ?, ?)",
+                        (ultimo, datetime.datetime.now()))
+        destino.execute("COMMIT")
+    finally:
+        origen.close()
+        destino.close()
+    os.replace(destino_temporal, ruta_replica)
+    return ultimo
+
+
+def _aplicar(cursor, tabla, operacion, clave, datos):
+    if operacion == "C":
+        trasladar_resumenes_a_corte(cursor, clave["fecha_negocio"], clave["corte_id"])
+        return
+    condicion = " AND ".join(f"{columna} = ?" for columna in clave)
+    if operacion == "D":
+        cursor.execute(f"DELETE FROM {tabla} WHERE {condicion}", tuple(clave.values()))
+    elif operacion == "U":
+        # Sólo se actualizan las columnas que cambiaron, para que los triggers de la copia
+        # (resúmenes, búsqueda) se disparen igual que en la principal
+        columnas = list(datos)
+        cursor.execute(f"SELECT {', '.join(columnas)} FROM {tabla} WHERE {condicion}", tuple(clave.values()))
+        actual = cursor.fetchone()
+        if actual is None:
+            _aplicar(cursor, tabla, "I", clave, datos)
+            return
+        cambios = {c: v for c, v, anterior in zip(columnas, datos.values(), actual) if v != anterior}
+        if cambios:
+            asignaciones = ", ".join(f"{columna} = ?" for columna in cambios)
+            cursor.execute(f"UPDATE {tabla} SET {asignaciones} WHERE {condicion}",
+                           tuple(cambios.values()) + tuple(clave.values()))
+    else:
+        columnas = ", ".join(datos)
+        marcadores = ", ".join("?" for _ in datos)
+        cursor.execute(f"INSERT OR REPLACE INTO {tabla} ({columnas}) VALUES ({marcadores})", tuple(datos.values()))
+
+
+def _hay_hueco(gestor, ultimo):
+    """ True si la bitácora principal ya no tiene algún cambio posterior a `ultimo` (se vació sin enviarlo). """
+    siguiente = gestor.consultar_uno("SELECT MIN(id) FROM Registro_Cambios WHERE id > ?", (ultimo,))[0]
+    if siguiente is not None:
+        return siguiente != ultimo + 1
+    fila = gestor.consultar_uno("SELECT seq FROM sqlite_sequence WHERE name = 'Registro_Cambios'")
+    return fila is not None and fila[0] > ultimo
+
+
+def enviar_cambios(gestor, ruta_replica, lote=5000):
+    """ Aplica en la copia los cambios pendientes de la bitácora y los borra de la principal.
+
+    Si la copia no existe, le faltan cambios o la bitácora estaba apagada se vuelve a copiar
+    completa. Devuelve cuántos cambios se aplicaron.
+    """
+    if not registro_activo(gestor):
+        # Mientras estuvo apagada no se anotó nada: una copia anterior ya no sirve
+        with gestor.transaccion() as cursor:
+            cursor.execute("UPDATE Estado_Registro SET activo = 1, enviado_en = ? WHERE id = 1", (datetime.datetime.now(),))
+        print(f"Bitácora de cambios encendida; se copia completa la base en espera '{ruta_replica}'.")
+        crear_replica(gestor.ruta, ruta_replica)
+    elif not os.path.exists(ruta_replica):
+        crear_replica(gestor.ruta, ruta_replica)
+    destino = sqlite3.connect(ruta_replica, isolation_level=None)
+    try:
+        ultimo = destino.execute("SELECT ultimo_cambio FROM Estado_Replica WHERE id = 1").fetchone()[0]
+        if _hay_hueco(gestor, ultimo):
+            print(f"ADVERTENCIA: A la base en espera '{ruta_replica}' le faltan cambios; se copia completa de nuevo.")
+            destino.close()
+            ultimo = crear_replica(gestor.ruta, ruta_replica)
+            destino = sqlite3.connect(ruta_replica, isolation_level=None)
+        cambios = gestor.consultar(
+            "SELECT id, tabla, operacion, clave, datos FROM Registro_Cambios WHERE id > ? ORDER BY id LIMIT ?", (ultimo, lote))
+        if cambios:
+            destino.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = destino.cursor()
+                for _, tabla, operacion, clave, datos in cambios:
+                    _aplicar(cursor, tabla, operacion, json.loads(clave), json.loads(datos) if datos else None)
+                # Lo que anotaron los triggers de la propia copia no se vuelve a enviar
+                cursor.execute("DELETE FROM Registro_Cambios")
+                ultimo = cambios[-1][0]
+                cursor.execute("UPDATE Estado_Replica SET ultimo_cambio = ?, actualizado_en = ? WHERE id = 1",
+                               (ultimo, datetime.datetime.now()))
+                destino.execute("COMMIT")
+            except Exception:
+                destino.execute("ROLLBACK")
+                raise
+    finally:
+        destino.close()
+    with gestor.transaccion() as cursor:
+        cursor.execute("DELETE FROM Registro_Cambios WHERE id <= ?", (ultimo,))
+        # El mantenimiento apaga la bitácora si enviado_en se queda atrás
+        cursor.execute("UPDATE Estado_Registro SET enviado_en = ? WHERE id = 1", (datetime.datetime.now(),))
+    return len(cambios)
+
+
+def registro_activo(gestor):
+    """ True si los triggers están anotando los cambios en Registro_Cambios. """
+    fila = gestor.consultar_uno("SELECT activo FROM Estado_Registro WHERE id = 1")
+    return bool(fila and fila[0])
+
+
+def desactivar_registro(gestor):
+    """ Apaga y vacía la bitácora, p. ej. al quitar la base en espera de la configuración. """
+    with gestor.transaccion() as cursor:
+        cursor.execute("UPDATE Estado_Registro SET activo = 0, enviado_en = NULL WHERE id = 1")
+        cursor.execute("DELETE FROM Registro_Cambios")
+
+
+def promover(ruta_replica, ruta_principal=None):
+    """ Convierte la copia en espera en base principal; con ruta_principal se copia ahí (p. ej. al disco nuevo). """
+    conn = sqlite3.connect(ruta_replica, isolation_level=None)
+    try:
+        resultado = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if resultado != "ok":
+            raise RuntimeError(f"La base en espera no pasó la verificación de integridad: {resultado}")
+        conn.execute("DROP TABLE IF EXISTS Estado_Replica")
+        conn.execute("DELETE FROM Registro_Cambios")
+        if ruta_principal:
+            destino = sqlite3.connect(ruta_principal)
+            try:
+                conn.backup(destino)
+            finally:
+                destino.close()
+    finally:
+        conn.close()
+    return ruta_principal or ruta_replica
+
+
+class ServicioReplica(threading.Thread):
+    """ Hilo que envía la bitácora a la base en espera cada `intervalo` segundos. """
+
+    def __init__(self, gestor, ruta_replica, intervalo=5):
+        super().__init__(name="ServicioReplica", daemon=True)
+        self.gestor = gestor
+        self.ruta_replica = ruta_replica
+        self.intervalo = intervalo
+        self._solicitudes = queue.Queue()
+        self._fallando = False
+
+    def solicitar(self):
+        self._solicitudes.put(True)
+
+    def run(self):
+        while True:
+            try:
+                solicitud = self._solicitudes.get(timeout=self.intervalo)
+            except queue.Empty:
+                solicitud = True
+            if solicitud is None:
+                break
+            try:
+                enviar_cambios(self.gestor, self.ruta_replica)
+                if self._fallando:
+                    print(f"Base en espera '{self.ruta_replica}' al día de nuevo.")
+                self._fallando = False
+            except Exception as e:
+                # Sin la memoria USB puesta fallaría cada pocos segundos: sólo se avisa una vez
+                if not self._fallando:
+                    print(f"ERROR: No se pudo actualizar la base en espera '{self.ruta_replica}': {e}")
+                self._fallando = True
+
+    def detener(self):
+        """ Envía lo pendiente antes de terminar. """
+        self._solicitudes.put(True)
+        self._solicitudes.put(None)
+        self.join()
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "enviar":
+        gestor = GestorBD(sys.argv[2])
+        aplicar_migraciones(gestor)
+        print(f"Cambios enviados: {enviar_cambios(gestor, sys.argv[3])}")
+        gestor.cerrar()
+    elif len(sys.argv) >= 3 and sys.argv[1] == "desactivar":
+        gestor = GestorBD(sys.argv[2])
+        aplicar_migraciones(gestor)
+        desactivar_registro(gestor)
+        print("Bitácora de cambios desactivada.")
+        gestor.cerrar()
+    elif len(sys.argv) >= 3 and sys.argv[1] == "promover":
+        ruta = promover(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Base promovida: {ruta}")
+    else:
+        print(__doc__)
+        sys.exit(1)
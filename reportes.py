@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Consultas de los reportes de corte de caja sobre las tablas de resumen.
+
+Los importes se suman en centavos enteros y se devuelven como Dinero.
+
+Ejecutado como script permite reconstruir los resúmenes desde Ventas:
+    python reportes.py reconstruir [ruta_db]
+"""
+import sys
+
+from archivo import consultar_archivo
+from dinero import Dinero
+
+# Corte al que pertenece una venta: el marcado en la fila (cortes antiguos) o el del rango de Cortes
+SQL_CORTE_DE_VENTA = """
+    COALESCE(v.corte_id,
+             (SELECT c.corte_id FROM Cortes c
+              WHERE c.fecha_negocio = COALESCE(v.fecha_negocio, DATE(v.fecha_hora))
+                AND v.id BETWEEN c.id_venta_desde AND c.id_venta_hasta),
+             '')
+"""
+
+SQL_RESUMEN_DESDE_VENTAS = f"""
+    SELECT COALESCE(v.fecha_negocio, DATE(v.fecha_hora)), {SQL_CORTE_DE_VENTA}, COUNT(*), SUM(v.total),
+           SUM(CASE WHEN v.metodo_pago = 'Efectivo' THEN v.total ELSE 0 END),
+           SUM(CASE WHEN v.metodo_pago = 'Tarjeta' THEN v.total ELSE 0 END),
+           SUM(COALESCE(v.descuento, 0))
+    FROM Ventas v GROUP BY 1, 2
+"""
+
+
+# En la base consolidada los reportes de una sola sucursal se calculan desde sus ventas
+SQL_TOTALES_SUCURSAL = """
+    SELECT COUNT(*), SUM(total), SUM(COALESCE(descuento, 0)),
+           SUM(CASE WHEN metodo_pago = 'Efectivo' THEN total ELSE 0 END),
+           SUM(CASE WHEN metodo_pago = 'Tarjeta' THEN total ELSE 0 END)
+    FROM Ventas WHERE sucursal = ? AND {condicion}
+"""
+
+SQL_PRODUCTOS_SUCURSAL = """
+    SELECT d.nombre, SUM(d.cantidad), SUM(d.cantidad * d.precio_unitario)
+    FROM Ventas v JOIN Detalle_Venta d ON d.id_venta = v.id
+    WHERE v.sucursal = ? AND {condicion}
+    GROUP BY d.nombre
+    ORDER BY SUM(d.cantidad) DESC
+"""
+
+
+def _totales(fila):
+    # (num_tickets, total, ...) con los importes como Dinero
+    if not fila:
+        return (0, Dinero(0), Dinero(0), Dinero(0), Dinero(0))
+    return (fila[0],) + tuple(Dinero(valor or 0) for valor in fila[1:])
+
+
+def resumen_del_dia(gestor, fecha, sucursal=None):
+    """ Totales de las ventas del día contable que aún no tienen corte.
+
+    Devuelve (num_tickets, total, total_descuento, total_efectivo, total_tarjeta).
+    """
+    if sucursal:
+        return _totales(gestor.consultar_uno(SQL_TOTALES_SUCURSAL.format(condicion="fecha_negocio = ? AND corte_id IS NULL"), (sucursal, fecha)))
+    fila = gestor.consultar_uno(
+        "SELECT num_tickets, total, total_descuento, total_efectivo, total_tarjeta FROM Resumen_Diario WHERE fecha_negocio = ? AND corte_id = ''",
+        (fecha,))
+    return _totales(fila)
+
+
+def resumen_de_corte(gestor, corte_id, sucursal=None):
+    """ Totales congelados de un corte ya cerrado, con el mismo formato que resumen_del_dia. """
+    if sucursal:
+        return _totales(gestor.consultar_uno(SQL_TOTALES_SUCURSAL.format(condicion="corte_id = ?"), (sucursal, corte_id)))
+    fila = gestor.consultar_uno(
+        "SELECT num_tickets, total, total_descuento, total_efectivo, total_tarjeta FROM Cortes WHERE corte_id = ?",
+        (corte_id,))
+    return _totales(fila)
+
+
+def lista_cortes(gestor, sucursal=None):
+    if sucursal:
+        return [fila[0] for fila in gestor.consultar(
+            "SELECT DISTINCT corte_id FROM Ventas WHERE sucursal = ? AND corte_id IS NOT NULL ORDER BY corte_id DESC", (sucursal,))]
+    return [fila[0] for fila in gestor.consultar("SELECT corte_id FROM Cortes ORDER BY corte_id DESC")]
+
+
+def _trasladar_a_corte(cursor, tabla, claves, copiadas, sumadas, fecha, corte_id):
+    # Suma las filas '' del día a las del corte (que ya existen si se cierra dos veces) y las borra
+    columnas = ", ".join(("fecha_negocio",) + claves + copiadas + sumadas)
+    destino = ", ".join(("fecha_negocio", "corte_id") + claves)
+    actualizar = ", ".join(f"{col} = {col} + excluded.{col}" for col in sumadas)
+    cursor.execute(f"""
+        INSERT INTO {tabla} (corte_id, {columnas})
+        SELECT ?, {columnas} FROM {tabla}
+        WHERE fecha_negocio = ? AND corte_id = ''
+        ON CONFLICT ({destino}) DO UPDATE SET {actualizar}
+    """, (corte_id, fecha))
+    cursor.execute(f"DELETE FROM {tabla} WHERE fecha_negocio = ? AND corte_id = ''", (fecha,))
+
+
+def cerrar_corte(gestor, fecha, momento):
+    """ Cierra las ventas sin corte del día contable con una sola fila en Cortes.
+
+    Devuelve el corte_id, o None si no había ventas por cerrar. Lanza ValueError si
+    Resumen_Diario tiene tickets abiertos pero no hay ventas sin corte que los respalden.
+    """
+    corte_id = fecha
+    with gestor.transaccion() as cursor:
+        cursor.execute("SELECT num_tickets, total, total_efectivo, total_tarjeta, total_descuento FROM Resumen_Diario WHERE fecha_negocio = ? AND corte_id = ''", (fecha,))
+        totales = cursor.fetchone()
+        if not totales or not totales[0]:
+            return None
+        # Las ventas sin corte del día son las que no caen en el rango de ningún cierre de ese
+        # mismo día. Los ids no siempre crecen con el tiempo: las ventas importadas (legado.py)
+        # pueden tener ids mayores que las de hoy.
+        cursor.execute("""
+            SELECT MIN(v.id), MAX(v.id), MIN(v.fecha_hora) FROM Ventas v
+            WHERE v.fecha_negocio = ? AND v.corte_id IS NULL
+              AND NOT EXISTS (SELECT 1 FROM Cortes c WHERE c.fecha_negocio = v.fecha_negocio
+                              AND v.id BETWEEN c.id_venta_desde AND c.id_venta_hasta)
+        """, (fecha,))
+        desde, hasta, abierto_en = cursor.fetchone()
+        if desde is None:
+            raise ValueError(f"Hay {totales[0]} tickets abiertos del {fecha} en Resumen_Diario pero ninguna venta sin corte; "
+                             "ejecute reconstruir_resumen_diario antes de cerrar.")
+        cursor.execute("""
+            INSERT INTO Cortes (corte_id, fecha_negocio, id_venta_desde, id_venta_hasta, abierto_en, cerrado_en,
+                                num_tickets, total, total_efectivo, total_tarjeta, total_descuento)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (corte_id) DO UPDATE SET
+                id_venta_desde = MIN(id_venta_desde, excluded.id_venta_desde),
+                id_venta_hasta = MAX(id_venta_hasta, excluded.id_venta_hasta),
+                cerrado_en = excluded.cerrado_en,
+                num_tickets = num_tickets + excluded.num_tickets,
+                total = total + excluded.total,
+                total_efectivo = total_efectivo + excluded.total_efectivo,
+                total_tarjeta = total_tarjeta + excluded.total_tarjeta,
+                total_descuento = total_descuento + excluded.total_descuento
+        """, (corte_id, fecha, desde, hasta, abierto_en, momento) + tuple(totales))
+        trasladar_resumenes_a_corte(cursor, fecha, corte_id)
+        # Los resúmenes no están en la bitácora: la base en espera repite este traslado
+        cursor.execute("""
+            INSERT INTO Registro_Cambios (tabla, operacion, clave)
+            SELECT 'Cortes', 'C', json_object('fecha_negocio', ?, 'corte_id', ?) FROM Estado_Registro WHERE id = 1 AND activo
+        """, (fecha, corte_id))
+    return corte_id
+
+
+def trasladar_resumenes_a_corte(cursor, fecha, corte_id):
+    """ Pasa las filas abiertas ('') del día de Resumen_Diario y Resumen_Producto_Diario al corte. """
+    _trasladar_a_corte(cursor, "Resumen_Diario", (), (),
+                       ("num_tickets", "total", "total_efectivo", "total_tarjeta", "total_descuento"), fecha, corte_id)
+    _trasladar_a_corte(cursor, "Resumen_Producto_Diario", ("id_producto",), ("nombre",),
+                       ("cantidad", "ingreso"), fecha, corte_id)
+
+
+SQL_VENTAS_POR_PRODUCTO = """
+    SELECT nombre, SUM(cantidad), SUM(ingreso) FROM {esquema}.Resumen_Producto_Diario
+    WHERE {condicion}
+    GROUP BY nombre
+    ORDER BY SUM(cantidad) DESC
+"""
+
+
+def _con_ingreso(filas):
+    return [(nombre, cantidad, Dinero(ingreso)) for nombre, cantidad, ingreso in filas]
+
+
+def productos_del_dia(gestor, fecha, sucursal=None):
+    """ (nombre, cantidad, ingreso) de las ventas sin corte del día contable. """
+    if sucursal:
+        return _con_ingreso(gestor.consultar(SQL_PRODUCTOS_SUCURSAL.format(condicion="v.fecha_negocio = ? AND v.corte_id IS NULL"), (sucursal, fecha)))
+    return _con_ingreso(gestor.consultar(SQL_VENTAS_POR_PRODUCTO.format(esquema="main", condicion="fecha_negocio = ? AND corte_id = ''"), (fecha,)))
+
+
+def productos_de_corte(gestor, corte_id, carpeta_archivo=None, sucursal=None):
+    """ Si el corte ya se movió al archivo anual, la consulta se hace sobre ese archivo. """
+    if sucursal:
+        return _con_ingreso(gestor.consultar(SQL_PRODUCTOS_SUCURSAL.format(condicion="v.corte_id = ?"), (sucursal, corte_id)))
+    fila = gestor.consultar_uno("SELECT archivo FROM Cortes WHERE corte_id = ?", (corte_id,))
+    if fila and fila[0] is not None and carpeta_archivo:
+        return _con_ingreso(consultar_archivo(gestor, carpeta_archivo, fila[0],
+                                              SQL_VENTAS_POR_PRODUCTO.format(esquema="archivo", condicion="corte_id = ?"), (corte_id,)))
+    return _con_ingreso(gestor.consultar(SQL_VENTAS_POR_PRODUCTO.format(esquema="main", condicion="corte_id = ?"), (corte_id,)))
+
+
+def productos_entre_fechas(gestor, desde, hasta, carpeta_archivo=None):
+    """ Incluye todas las ventas (con o sin corte) de los días contables desde..hasta. """
+    condicion = "fecha_negocio BETWEEN ? AND ?"
+    filas = gestor.consultar(SQL_VENTAS_POR_PRODUCTO.format(esquema="main", condicion=condicion), (desde, hasta))
+    anios = gestor.consultar("SELECT DISTINCT archivo FROM Cortes WHERE archivo IS NOT NULL AND fecha_negocio BETWEEN ? AND ?", (desde, hasta))
+    if not anios or not carpeta_archivo:
+        return _con_ingreso(filas)
+    # Se combinan los totales de la base principal con los de cada archivo anual del rango
+    combinados = {}
+    for anio, in anios:
+        filas += consultar_archivo(gestor, carpeta_archivo, anio,
+                                   SQL_VENTAS_POR_PRODUCTO.format(esquema="archivo", condicion=condicion), (desde, hasta))
+    for nombre, cantidad, ingreso in filas:
+        anterior = combinados.get(nombre, (0, 0))
+        combinados[nombre] = (anterior[0] + cantidad, anterior[1] + ingreso)
+    return sorted(((nombre, c, Dinero(i)) for nombre, (c, i) in combinados.items()), key=lambda fila: fila[1], reverse=True)
+
+
+def reconstruir_resumen_diario(gestor):
+    """ Regenera Resumen_Diario desde Ventas y devuelve las filas que no coincidían.
+
+    Las filas de cortes ya movidos al archivo anual se conservan tal cual.
+    """
+    no_archivado = "corte_id NOT IN (SELECT corte_id FROM Cortes WHERE archivo IS NOT NULL)"
+    with gestor.transaccion() as cursor:
+        cursor.execute(f"SELECT fecha_negocio, corte_id, num_tickets, total, total_efectivo, total_tarjeta, total_descuento FROM Resumen_Diario WHERE {no_archivado}")
+        anteriores = {fila[:2]: fila[2:] for fila in cursor.fetchall()}
+        cursor.execute(SQL_RESUMEN_DESDE_VENTAS)
+        nuevas = {fila[:2]: fila[2:] for fila in cursor.fetchall()}
+        cursor.execute(f"DELETE FROM Resumen_Diario WHERE {no_archivado}")
+        cursor.executemany(
+            "INSERT INTO Resumen_Diario (fecha_negocio, corte_id, num_tickets, total, total_efectivo, total_tarjeta, total_descuento) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [clave + valores for clave, valores in nuevas.items()])
+    diferencias = []
+    for clave in sorted(set(anteriores) | set(nuevas)):
+        antes, despues = anteriores.get(clave), nuevas.get(clave)
+        if antes is None or despues is None or antes != despues:
+            diferencias.append((clave, antes, despues))
+    return diferencias
+
+
+if __name__ == "__main__":
+    from base_datos import GestorBD
+    from migraciones import aplicar_migraciones
+
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir":
+        print(__doc__)
+        sys.exit(1)
+    gestor = GestorBD(sys.argv[2] if len(sys.argv) > 2 else "pos_database.db")
+    aplicar_migraciones(gestor)
+    diferencias = reconstruir_resumen_diario(gestor)
+    for (fecha, corte), antes, despues in diferencias:
+        print(f"{fecha} corte '{corte}': antes {antes} -> ahora {despues}")
+    print(f"Resumen diario reconstruido. Filas con diferencias: {len(diferencias)}")
+    gestor.cerrar()
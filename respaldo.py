@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Respaldo en línea de la base de datos con la API de backup de SQLite.
+
+La copia se hace por pasos de pocas páginas con una pausa entre cada uno, así que
+puede correr mientras se atiende sin frenar la interfaz ni el guardado de ventas.
+Cada copia se verifica con PRAGMA integrity_check antes de quedar en la carpeta
+(pos_respaldo_AAAAMMDD_HHMMSS.db) y sólo se conservan las más recientes.
+
+Uso como script:
+    python respaldo.py <ruta_db> <carpeta_respaldos> [copias_a_conservar]
+"""
+import datetime
+import glob
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+
+def ruta_respaldo(carpeta, momento):
+    return os.path.join(carpeta, f"pos_respaldo_{momento:%Y%m%d_%H%M%S}.db")
+
+
+def respaldar(ruta_db, carpeta, paginas=256, pausa=0.05, conservar=7, momento=None):
+    """ Copia la base a un archivo nuevo de la carpeta, lo verifica y rota los anteriores.
+
+    Devuelve la ruta de la copia. Si la verificación falla la copia se borra y se lanza RuntimeError.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    destino_final = ruta_respaldo(carpeta, momento or datetime.datetime.now())
+    destino_temporal = destino_final + ".tmp"
+    origen = sqlite3.connect(ruta_db, isolation_level=None)
+    destino = sqlite3.connect(destino_temporal)
+    try:
+        # Una transacción de lectura abierta fija la instantánea (WAL): las ventas que se
+        # guarden durante la copia no la obligan a reiniciar y quedan para el siguiente respaldo.
+        origen.execute("BEGIN")
+        origen.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        origen.backup(destino, pages=paginas, progress=lambda estado, restantes, total: time.sleep(pausa))
+        origen.execute("COMMIT")
+        resultado = destino.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        origen.close()
+        destino.close()
+    if resultado != "ok":
+        os.remove(destino_temporal)
+        raise RuntimeError(f"El respaldo no pasó la verificación de integridad: {resultado}")
+    os.replace(destino_temporal, destino_final)
+    rotar_respaldos(carpeta, conservar)
+    return destino_final
+
+
+def rotar_respaldos(carpeta, conservar):
+    """ Borra los respaldos más antiguos, dejando los `conservar` más recientes. """
+    respaldos = sorted(glob.glob(os.path.join(carpeta, "pos_respaldo_*.db")))
+    for ruta in respaldos[:max(0, len(respaldos) - conservar)]:
+        os.remove(ruta)
+
+
+class ServicioRespaldo(threading.Thread):
+    """ Hilo que hace los respaldos cuando se le piden y, opcionalmente, cada `intervalo` segundos. """
+
+    def __init__(self, ruta_db, carpeta, paginas=256, pausa=0.05, conservar=7, intervalo=0):
+        super().__init__(name="ServicioRespaldo", daemon=True)
+        self.ruta_db = ruta_db
+        self.carpeta = carpeta
+        self.paginas = paginas
+        self.pausa = pausa
+        self.conservar = conservar
+        self.intervalo = intervalo
+        self._solicitudes = queue.Queue()
+
+    def solicitar(self):
+        self._solicitudes.put(True)
+
+    def run(self):
+        while True:
+            try:
+                solicitud = self._solicitudes.get(timeout=self.intervalo or None)
+            except queue.Empty:
+                solicitud = True
+            if solicitud is None:
+                break
+            try:
+                ruta = respaldar(self.ruta_db, self.carpeta, self.paginas, self.pausa, self.conservar)
+                print(f"Respaldo creado: {ruta}")
+            except Exception as e:
+                print(f"ERROR: No se pudo respaldar la base de datos: {e}")
+
+    def detener(self):
+        self._solicitudes.put(None)
+        self.join()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    ruta = respaldar(sys.argv[1], sys.argv[2], conservar=int(sys.argv[3]) if len(sys.argv) > 3 else 7)
+    print(f"Respaldo creado: {ruta}")
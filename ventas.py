@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import datetime
+import queue
+import threading
+import time
+
+
+def fecha_negocio(momento, hora_corte=0):
+    """ Día contable de un momento: lo vendido antes de la hora de corte cuenta para el día anterior. """
+    return (momento - datetime.timedelta(hours=hora_corte)).date().isoformat()
+
+
+def insertar_venta(cursor, id_mesa, total, metodo_pago, descuento, paga_con, lineas, momento, hora_corte=0, terminal=None):
+    """ Inserta el encabezado y las líneas de una venta y devuelve el id asignado.
+
+    lineas es una lista de tuplas (id_producto, nombre, categoria, cantidad, precio_unitario); los
+    importes van en centavos. El nombre y la categoría quedan guardados tal como se vendieron.
+    terminal identifica la caja que registró la venta cuando varias comparten la base.
+    """
+    cursor.execute(
+        "INSERT INTO Ventas (id_mesa, total, metodo_pago, descuento, paga_con, fecha_hora, fecha_negocio, fecha_epoch, terminal) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (id_mesa, total, metodo_pago, descuento, paga_con, momento, fecha_negocio(momento, hora_corte), int(momento.timestamp()), terminal)
+    )
+    id_venta = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO Detalle_Venta (id_venta, linea, id_producto, nombre, categoria, cantidad, precio_unitario) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(id_venta, numero) + tuple(linea) for numero, linea in enumerate(lineas, start=1)]
+    )
+    return id_venta
+
+
+class EscritorVentas(threading.Thread):
+    """ Hilo único que guarda las ventas fuera del hilo de Tk.
+
+    Las ventas que llegan casi al mismo tiempo se escriben en una sola transacción
+    (un solo commit). El id asignado a cada venta se entrega al callback desde el
+    hilo de Tk, que debe llamar periódicamente a despachar_resultados().
+    """
+
+    def __init__(self, gestor, hora_corte=0, espera_grupo=0.02, max_grupo=32, terminal=None):
+        super().__init__(name="EscritorVentas", daemon=True)
+        self.gestor = gestor
+        self.hora_corte = hora_corte
+        self.terminal = terminal
+        self.espera_grupo = espera_grupo
+        self.max_grupo = max_grupo
+        self._pendientes = queue.Queue()
+        self._resultados = queue.Queue()
+
+    def encolar(self, venta, al_guardar, al_fallar=None):
+        """ venta: dict con id_mesa, total, metodo_pago, descuento, paga_con, lineas y momento. """
+        self._pendientes.put((venta, al_guardar, al_fallar))
+
+    def run(self):
+        activo = True
+        while activo:
+            trabajo = self._pendientes.get()
+            if trabajo is None:
+                self._pendientes.task_done()
+                break
+            grupo = [trabajo]
+            limite = time.monotonic() + self.espera_grupo
+            while len(grupo) < self.max_grupo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    trabajo = self._pendientes.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if trabajo is None:
+                    self._pendientes.task_done()
+                    activo = False
+                    break
+                grupo.append(trabajo)
+            self._guardar_grupo(grupo)
+            for _ in grupo:
+                self._pendientes.task_done()
+
+    def _guardar_grupo(self, grupo):
+        try:
+            with self.gestor.transaccion() as cursor:
+                ids = [insertar_venta(cursor, hora_corte=self.hora_corte, terminal=self.terminal, **venta) for venta, _, _ in grupo]
+        except Exception:
+            # Si falla el grupo completo, cada venta se intenta por separado para no perder las demás
+            for venta, al_guardar, al_fallar in grupo:
+                try:
+                    with self.gestor.transaccion() as cursor:
+                        id_venta = insertar_venta(cursor, hora_corte=self.hora_corte, terminal=self.terminal, **venta)
+                except Exception as e:
+                    print(f"ERROR: No se pudo guardar la venta de la mesa {venta['id_mesa']}: {e}")
+                    if al_fallar:
+                        self._resultados.put((al_fallar, e))
+                else:
+                    self._resultados.put((al_guardar, id_venta))
+        else:
+            for (_, al_guardar, _), id_venta in zip(grupo, ids):
+                self._resultados.put((al_guardar, id_venta))
+
+    def despachar_resultados(self):
+        """ Ejecuta en el hilo que la llama (el de Tk) los callbacks de las ventas ya procesadas. """
+        while True:
+            try:
+                callback, valor = self._resultados.get_nowait()
+            except queue.Empty:
+                return
+            callback(valor)
+
+    def vaciar(self):
+        """ Bloquea hasta que todas las ventas encoladas hayan sido escritas. """
+        self._pendientes.join()
+
+    def detener(self):
+        self._pendientes.put(None)
+        self.join()